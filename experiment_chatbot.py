@@ -5,16 +5,23 @@ import chainlit as cl
 from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
 from chainlit.input_widget import TextInput
 
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
 from autogen_agentchat.base import Response
-from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.messages import TextMessage, ModelClientStreamingChunkEvent
 from autogen_core.models import RequestUsage
 
 from src.agents.cba import ChatbotAgent
+from src.agents.context import MEMORY_MARKER
+from src.agents.pool import AgentPool
 from src.chat_history.database_setup import ChatHistoryDatabase
-from src.memory.azure_ai_search import AzureAISearch
+from src.embedding.cache import EmbeddingCache
+from src.memory.cached_store import CachedMemoryStore
+from src.memory.factory import create_memory_store
+from src.memory.recall_tracker import RecallTracker
 from src.service.memory_builder import MemoryBuilder
+from src.service.memory_evictor import create_memory_evictor
+from src.utils.constants import Constants
 
 load_dotenv(override=True)
 
@@ -22,6 +29,8 @@ load_dotenv(override=True)
 # If set to False, the assistant will use the memory builder to build memory and persist it.
 # If set to True, the assistant will use the memory builder to retrieve memory and use it in the conversation, it will not build or persist memory.
 USE_MEMORY = True
+# Token budget of the conversation sent to the model, memory blocks of earlier turns are dropped first, then the oldest turns.
+MAX_CONTEXT_TOKENS = 4000
 
 print("================Starting Initialization================")
 az_openai_model_client = AzureOpenAIChatCompletionClient(
@@ -36,45 +45,48 @@ az_embedding_client = AzureOpenAI(
     api_key=os.environ['AZURE_OPENAI_API_KEY'],
     api_version=os.environ['AZURE_OPENAI_EMBEDDING_API_VERSION'],
 )
-az_embedding_model = os.environ['AZURE_OPENAI_EMBEDDING_MODEL']
-az_ai_search_client = AzureAISearch(
-    endpoint=os.environ['AZURE_SEARCH_ENDPOINT'],
-    key=os.environ['AZURE_SEARCH_API_KEY'],
-    index_name=os.environ['AZURE_SEARCH_INDEX_NAME']
+az_async_embedding_client = AsyncAzureOpenAI(
+    azure_endpoint=os.environ['AZURE_OPENAI_BASE_URL'],
+    api_key=os.environ['AZURE_OPENAI_API_KEY'],
+    api_version=os.environ['AZURE_OPENAI_EMBEDDING_API_VERSION'],
 )
-az_ai_search_client.create_index(model=az_embedding_client)
+az_embedding_model = os.environ['AZURE_OPENAI_EMBEDDING_MODEL']
+embedding_cache = EmbeddingCache(path=Constants.embedding_cache_path)
+memory_store = CachedMemoryStore(create_memory_store())
+memory_store.create_index(model=az_embedding_model)
+recall_tracker = RecallTracker(search_client=memory_store)
 memory_builder = MemoryBuilder(
     model_client=az_openai_model_client,
-    search_client=az_ai_search_client,
+    search_client=memory_store,
     embedding_client=az_embedding_client,
-    embedding_model=az_embedding_model
+    embedding_model=az_embedding_model,
+    async_embedding_client=az_async_embedding_client,
+    embedding_cache=embedding_cache,
+    extraction_mode="concurrent",
+    memory_evictor=create_memory_evictor(memory_store, archive_path=Constants.memory_archive_path),
+    recall_tracker=recall_tracker
 )
+chatbot_agent_pool = AgentPool(lambda: ChatbotAgent(model_client=az_openai_model_client, use_memory=USE_MEMORY, stream=True,
+                                                  max_context_tokens=MAX_CONTEXT_TOKENS).get_agent(), max_size=32)
 chat_history_storage = ChatHistoryDatabase(enable_storage_provider=False)
 print("================Initialization Complete===============")
 
-def get_memory(query: str, top: int = 2, threshold: float = 0.02) -> str:
-    query_vector = memory_builder.encode_text(query)
-    residual_memories = az_ai_search_client.search_memory(
-        query=query,
-        query_vector=query_vector,
-        type="residual",
-        top=top,
-        relevance_threshold=threshold
-    )
-    user_question_memories = az_ai_search_client.search_memory(
-        query=query,
-        query_vector=query_vector,
-        type="user_question",
-        top=top,
-        relevance_threshold=threshold
-    )
-    assistant_memories = az_ai_search_client.search_memory(
-        query=query,
-        query_vector=query_vector,
-        type="assistant_response",
-        top=top,
-        relevance_threshold=threshold
-    )
+async def get_memory(query: str, top: int = 2, threshold: float = 0.02) -> str:
+    # Chainlit owns the event loop, so the periodic recall write-back starts with the first search.
+    await recall_tracker.start()
+    memories = memory_store.get_cached_memories(query=query, top=top, relevance_threshold=threshold)
+    if memories is None:
+        query_vector = await memory_builder.encode_text_async(query)
+        memories = await memory_store.asearch_memories(
+            query=query,
+            query_vector=query_vector,
+            top=top,
+            relevance_threshold=threshold
+        )
+    recall_tracker.record(memories)
+    residual_memories = memories["residual"]
+    user_question_memories = memories["user_question"]
+    assistant_memories = memories["assistant_response"]
     return f"""
 {memory_builder.get_memory_string("LLM Response", assistant_memories)}
 {memory_builder.get_memory_string("Residual", residual_memories)}
@@ -108,32 +120,47 @@ async def start_chat():
     cl.user_session.set("total_usage", RequestUsage(prompt_tokens=0, completion_tokens=0))
 
 async def run_agent(query: str):
-    chatbot_agent = ChatbotAgent(model_client=az_openai_model_client, use_memory=USE_MEMORY).get_agent()
     if USE_MEMORY:
-        memory = get_memory(query)
+        memory = await get_memory(query)
         print(f"=======> Memory: {memory}")
-        query = f"{query}\n{memory}"
+        query = f"{query}\n\n{MEMORY_MARKER}{memory}"
     query_message = TextMessage(content=query, source="User")
     total_usage = cl.user_session.get("total_usage")
     message_history = cl.user_session.get("message_history")
     message_history.append(query_message)
-    response_stream = chatbot_agent.on_messages_stream(messages=message_history, cancellation_token=None)
-    async for msg in response_stream:
-        print(f"=======> Agent response: {msg}")
-        if isinstance(msg, Response):
-            message_content = msg.chat_message.content
-            message_metadata = {
-                "experiment": cl.context.session.chat_settings.get("experiment", None)
-            }
-            if msg.chat_message.models_usage:
-                message_metadata["completion_tokens"] = msg.chat_message.models_usage.completion_tokens
-                message_metadata["prompt_tokens"] = msg.chat_message.models_usage.prompt_tokens
-                total_usage.completion_tokens += msg.chat_message.models_usage.completion_tokens
-                total_usage.prompt_tokens += msg.chat_message.models_usage.prompt_tokens
-            cl_msg = cl.Message(content=message_content, author=msg.chat_message.source, metadata=message_metadata)
-            await cl_msg.send()
-        message_history.append(msg.chat_message)
-        print(f"=======> Message history: {message_history}")
+    # The full history is replayed every turn, so any pooled agent (reset on release) can serve it.
+    async with chatbot_agent_pool.agent() as chatbot_agent:
+        response_stream = chatbot_agent.on_messages_stream(messages=message_history, cancellation_token=None)
+        cl_msg = None
+        async for msg in response_stream:
+            if isinstance(msg, ModelClientStreamingChunkEvent):
+                # Tokens are shown as they arrive, the final Response completes the same message.
+                if cl_msg is None:
+                    cl_msg = cl.Message(content="", author=msg.source)
+                await cl_msg.stream_token(msg.content)
+                continue
+            print(f"=======> Agent response: {msg}")
+            if isinstance(msg, Response):
+                message_content = msg.chat_message.content
+                message_metadata = {
+                    "experiment": cl.context.session.chat_settings.get("experiment", None)
+                }
+                if msg.chat_message.models_usage:
+                    message_metadata["completion_tokens"] = msg.chat_message.models_usage.completion_tokens
+                    message_metadata["prompt_tokens"] = msg.chat_message.models_usage.prompt_tokens
+                    total_usage.completion_tokens += msg.chat_message.models_usage.completion_tokens
+                    total_usage.prompt_tokens += msg.chat_message.models_usage.prompt_tokens
+                context_stats = chatbot_agent.get_context_stats()
+                if context_stats:
+                    message_metadata["context_saved_tokens"] = context_stats["saved_tokens"]
+                    print(f"=======> Context: {context_stats}")
+                if cl_msg is None:
+                    cl_msg = cl.Message(content=message_content, author=msg.chat_message.source)
+                cl_msg.content = message_content
+                cl_msg.metadata = message_metadata
+                await cl_msg.send()
+                message_history.append(msg.chat_message)
+            print(f"=======> Message history: {message_history}")
 
 @cl.on_message  # type: ignore
 async def chat(message: cl.Message):
@@ -166,6 +193,9 @@ async def end_chat():
         # Persist Memory
         await memory_builder.persist_memory(memory_builder_response)
         
+    # Write back buffered memory recalls
+    await recall_tracker.flush()
+
     # Reset
     cl.user_session.set("message_history", [])
     cl.user_session.set("total_usage", RequestUsage(prompt_tokens=0, completion_tokens=0))
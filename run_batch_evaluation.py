@@ -1,13 +1,19 @@
 import os
 import json
 import uuid
+from typing import Iterable, Iterator
 from dotenv import load_dotenv
 from argparse import ArgumentParser
 
 from openai import AzureOpenAI
 
 from src.evaluation.info_cap_score import InformationCaptureScore
+from src.evaluation.key_point_cache import KeyPointCache
 from src.data.model import EvaluationData
+from src.data.result_writer import ResultWriter
+from src.embedding.cache import EmbeddingCache
+from src.embedding.service import EmbeddingService
+from src.utils.constants import Constants
 
 load_dotenv(override=True)
 
@@ -21,56 +27,119 @@ az_embedding_client = AzureOpenAI(
     api_key=os.environ['AZURE_OPENAI_API_KEY'],
     api_version=os.environ['AZURE_OPENAI_EMBEDDING_API_VERSION'],
 )
+embedding_cache = EmbeddingCache(path=Constants.embedding_cache_path)
+embedding_service = EmbeddingService(
+    embedding_client=az_embedding_client,
+    model=os.environ['AZURE_OPENAI_EMBEDDING_MODEL'],
+    embedding_cache=embedding_cache
+)
+key_point_cache = KeyPointCache(path=Constants.key_point_cache_path)
 info_cap_score = InformationCaptureScore()
 
-def persist_evaluation(answers: list[EvaluationData], summary: dict[str, float], file_path: str = ".evaluation_output_data"):
-    if not os.path.exists(file_path):
-        os.makedirs(file_path)
+def get_evaluation_files(file_path: str = ".evaluation_output_data") -> tuple[str, str]:
     unique_id =str(uuid.uuid4())
-    evaluation_result_file = os.path.join(file_path, f"{unique_id}_full.jsonl")
-    with open(evaluation_result_file, "w") as f:
-        for answer in answers:
-            f.write(json.dumps(answer.to_dict()))
-            f.write("\n")
-    evaluation_summary_file = os.path.join(file_path, f"{unique_id}_summary.json")
-    with open(evaluation_summary_file, "w") as f:
+    return os.path.join(file_path, f"{unique_id}_full.jsonl"), os.path.join(file_path, f"{unique_id}_summary.json")
+
+def persist_summary(summary: dict[str, float], evaluation_summary_file: str):
+    # Written to a temporary file and renamed, so the summary on disk always matches complete chunks.
+    temp_file = f"{evaluation_summary_file}.tmp"
+    with open(temp_file, "w") as f:
         f.write(json.dumps(summary))
-    print(f"\n\n**** Evaluation results saved to {evaluation_result_file} and {evaluation_summary_file}")
+    os.replace(temp_file, evaluation_summary_file)
 
-def run_evaluation(answers: list[EvaluationData]):
+def run_evaluation(chunks: Iterable[list[EvaluationData]], writer: ResultWriter, evaluation_summary_file: str, concurrency: int = 1) -> dict:
+    """
+    Score the answers chunk by chunk, appending scored records to writer and refreshing the summary after every chunk
+    """
     info_cap_score.set_weights(key_point_cov_score_weight=0.5, info_cov_score_weight=0.5)
-    answers_with_scores = info_cap_score.evaluate(
-        answers=answers,
+    scored_chunks = info_cap_score.evaluate_chunks(
+        chunks,
         openai_client=az_chat_completion_client,
         embedding_client=az_embedding_client,
         openai_model=os.environ['AZURE_OPENAI_EVALUATION_DEPLOYMENT_NAME'],
         embedding_model=os.environ['AZURE_OPENAI_EMBEDDING_MODEL'],
         key_point_cs_threshold=0.8,
-        info_cov_cs_threshold=0.9
+        info_cov_cs_threshold=0.9,
+        embedding_service=embedding_service,
+        key_point_cache=key_point_cache,
+        concurrency=concurrency
+    )
+    summary = {}
+    for answers_with_scores in scored_chunks:
+        for answer in answers_with_scores:
+            writer.write(answer)
+        summary = {**info_cap_score.get_score(), "answers": writer.count}
+        persist_summary(summary, evaluation_summary_file)
+        print(f"Scored {writer.count} answers: {summary}")
+    print(f"Key point cache: {key_point_cache.get_stats()}")
+    print(f"Embedding cache: {embedding_cache.get_stats()}")
+    print(f"Embedding service: {embedding_service.get_stats()}")
+    return summary
+
+def warm_key_point_cache(file_path: str):
+    # Accepts experiment results (expected_answer) or a raw MedMCQA file (exp).
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File {file_path} not found.")
+    texts = []
+    with open(file_path, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            texts.append(record.get("expected_answer") or record.get("exp"))
+    extracted = info_cap_score.key_point_cov_score_client.warm_key_point_cache(
+        texts=texts,
+        openai_client=az_chat_completion_client,
+        openai_model=os.environ['AZURE_OPENAI_EVALUATION_DEPLOYMENT_NAME'],
+        key_point_cache=key_point_cache
     )
-    print(info_cap_score.get_score())
-    return answers_with_scores
+    print(f"Warmed key point cache from {file_path} with {extracted} new extractions.")
 
 def load_data(file_path: str) -> list[EvaluationData]:
-    answers = []
+    return [answer for chunk in iter_data(file_path) for answer in chunk]
+
+def iter_data(file_path: str, chunk_size: int = None) -> Iterator[list[EvaluationData]]:
+    """
+    Read the answers in chunks of chunk_size records (the whole file as one chunk by default)
+    """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File {file_path} not found.")
+    chunk = []
     with open(file_path, "r") as f:
         for line in f:
+            if not line.strip():
+                continue
             answer = json.loads(line)
-            evaluation_data = EvaluationData(question=answer["question"],
-                                            generated_answer=answer["generated_answer"],
-                                            expected_answer=answer["expected_answer"] if "expected_answer" in answer else None,
-                                            session_id=answer["session_id"] if "session_id" in answer else None,
-                                            turn_id=answer["turn_id"]) if "turn_id" in answer else None
-            answers.append(evaluation_data)
-    return answers
+            chunk.append(EvaluationData(question=answer["question"],
+                                        generated_answer=answer["generated_answer"],
+                                        expected_answer=answer.get("expected_answer"),
+                                        session_id=answer.get("session_id"),
+                                        turn_id=answer.get("turn_id")))
+            if chunk_size and len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--file", type=str, required=True, help="Path to the file containing the answers.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Number of answers scored in parallel.")
+    parser.add_argument("--chunk_size", type=int, help="Number of answers read and scored at a time, scores are saved after every chunk. The whole file is one chunk by default.")
+    parser.add_argument("--warm_cache", type=str, help="Dataset file whose expected answers are pre-extracted into the key point cache.")
     args = parser.parse_args()
     file = args.file
-    answers = load_data(file)
-    answers_with_scores = run_evaluation(answers=answers)
-    persist_evaluation(answers=answers_with_scores, summary=info_cap_score.get_score())
+    evaluation_result_file, evaluation_summary_file = get_evaluation_files()
+    try:
+        if args.warm_cache:
+            warm_key_point_cache(args.warm_cache)
+        with ResultWriter(evaluation_result_file) as writer:
+            try:
+                summary = run_evaluation(iter_data(file, chunk_size=args.chunk_size), writer=writer,
+                                         evaluation_summary_file=evaluation_summary_file, concurrency=args.concurrency)
+            except KeyboardInterrupt:
+                print(f"\n\n**** Interrupted, {writer.count} scored answers saved to {evaluation_result_file} and {evaluation_summary_file}")
+                raise
+    finally:
+        # The batching worker and its request pool are shut down on errors and interrupts too.
+        embedding_service.close()
+    print(summary)
+    print(f"\n\n**** Evaluation results saved to {evaluation_result_file} and {evaluation_summary_file}")
@@ -1,8 +1,9 @@
 import os
 import uuid
 import asyncio
-import json
 import pandas as pd
+from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from argparse import ArgumentParser
 
@@ -12,10 +13,18 @@ from autogen_agentchat.base import Response
 from autogen_agentchat.messages import TextMessage
 
 from src.agents.cba import ChatbotAgent
+from src.agents.pool import AgentPool
+from src.data.artifact_cache import DatasetArtifactCache
 from src.data.med_mcqa import MedMCQADataSet
 from src.data.model import EvaluationData
-from src.memory.azure_ai_search import AzureAISearch
+from src.data.result_writer import ResultWriter
+from src.embedding.cache import EmbeddingCache
+from src.memory.cached_store import CachedMemoryStore
+from src.memory.factory import create_memory_store
+from src.memory.recall_tracker import RecallTracker
 from src.service.memory_builder import MemoryBuilder
+from src.service.memory_evictor import create_memory_evictor
+from src.utils.constants import Constants
 
 import warnings; warnings.simplefilter('ignore')
 
@@ -40,128 +49,183 @@ az_embedding_client = AzureOpenAI(
     api_version=os.environ['AZURE_OPENAI_EMBEDDING_API_VERSION'],
 )
 az_embedding_model = os.environ['AZURE_OPENAI_EMBEDDING_MODEL']
-az_ai_search_client = AzureAISearch(
-    endpoint=os.environ['AZURE_SEARCH_ENDPOINT'],
-    key=os.environ['AZURE_SEARCH_API_KEY'],
-    index_name=os.environ['AZURE_SEARCH_INDEX_NAME']
-)
-az_ai_search_client.create_index(model=az_embedding_client)
+embedding_cache = EmbeddingCache(path=Constants.embedding_cache_path)
+memory_store = CachedMemoryStore(create_memory_store())
+memory_store.create_index(model=az_embedding_model)
+recall_tracker = RecallTracker(search_client=memory_store)
 memory_builder = MemoryBuilder(
     model_client=az_openai_model_client,
-    search_client=az_ai_search_client,
+    search_client=memory_store,
     embedding_client=az_embedding_client,
-    embedding_model=az_embedding_model
+    embedding_model=az_embedding_model,
+    embedding_cache=embedding_cache,
+    memory_evictor=create_memory_evictor(memory_store, archive_path=Constants.memory_archive_path),
+    recall_tracker=recall_tracker
 )
+# Agents are built on demand, run_agents sizes the pool to --concurrency so every in-flight record gets its own agent.
+chatbot_agent_pool = AgentPool(lambda: ChatbotAgent(model_client=az_openai_model_client, use_memory=USE_MEMORY).get_agent(), max_size=1)
 print("================Initialization Complete===============")
 
 def get_memory(query: str, top: int = 3, threshold: float = 0.01) -> str:
-    query_vector = memory_builder.encode_text(query)
-    residual_memories = az_ai_search_client.search_memory(
-        query=query,
-        query_vector=query_vector,
-        type="residual",
-        top=top,
-        relevance_threshold=threshold
-    )
-    user_question_memories = az_ai_search_client.search_memory(
-        query=query,
-        query_vector=query_vector,
-        type="user_question",
-        top=top,
-        relevance_threshold=threshold
-    )
-    assistant_memories = az_ai_search_client.search_memory(
-        query=query,
-        query_vector=query_vector,
-        type="assistant_response",
-        top=top,
-        relevance_threshold=threshold
-    )
+    memories = memory_store.get_cached_memories(query=query, top=top, relevance_threshold=threshold)
+    if memories is None:
+        query_vector = memory_builder.encode_text(query)
+        memories = memory_store.search_memories(
+            query=query,
+            query_vector=query_vector,
+            top=top,
+            relevance_threshold=threshold
+        )
+    recall_tracker.record(memories)
+    residual_memories = memories["residual"]
+    user_question_memories = memories["user_question"]
+    assistant_memories = memories["assistant_response"]
     return f"""
 {memory_builder.get_memory_string("LLM Response", assistant_memories)}
 {memory_builder.get_memory_string("Residual", residual_memories)}
 {memory_builder.get_memory_string("User Question", user_question_memories)}
     """
 
-async def run_agent(eval_data: EvaluationData) -> EvaluationData:
+async def run_agent(eval_data: EvaluationData, memory_executor: ThreadPoolExecutor = None) -> EvaluationData:
     query = eval_data.question
-    chatbot_agent = ChatbotAgent(model_client=az_openai_model_client, use_memory=USE_MEMORY).get_agent()
     if USE_MEMORY:
-        memory = get_memory(query)
+        memory = await asyncio.get_running_loop().run_in_executor(memory_executor, get_memory, query)
         query = f"## Memories:{memory}\n\n## Question:\n{query}"
     query_message = TextMessage(content=query, source="User")
     message_history = [query_message]
-    response_stream = chatbot_agent.on_messages_stream(messages=message_history, cancellation_token=None)
-    async for msg in response_stream:
-        if isinstance(msg, Response):
-            message_content = msg.chat_message.content
-            eval_data.generated_answer = message_content
-            eval_data.prompt_token_count = msg.chat_message.models_usage.prompt_tokens
-            eval_data.completion_token_count = msg.chat_message.models_usage.completion_tokens
-            return eval_data
-        else:
-            print(f"*** [AGENT_ERROR]: {msg}")
-            return eval_data
-
-def load_data(file_path: str, limit: int = 10, type: str = "med_mcqa") -> list[EvaluationData]:
-    data = []
+    async with chatbot_agent_pool.agent() as chatbot_agent:
+        response_stream = chatbot_agent.on_messages_stream(messages=message_history, cancellation_token=None)
+        async for msg in response_stream:
+            if isinstance(msg, Response):
+                message_content = msg.chat_message.content
+                eval_data.generated_answer = message_content
+                eval_data.prompt_token_count = msg.chat_message.models_usage.prompt_tokens
+                eval_data.completion_token_count = msg.chat_message.models_usage.completion_tokens
+                return eval_data
+            else:
+                print(f"*** [AGENT_ERROR]: {msg}")
+                return eval_data
+
+async def run_agents(answers: Iterable[EvaluationData], writer: ResultWriter, concurrency: int = 1, ordered: bool = True) -> int:
+    """
+    Run the agent on every record with at most concurrency records in flight, streaming results to writer as they finish
+    """
+    records = enumerate(answers)
+    completed: dict[int, EvaluationData | None] = {}
+    next_index = 0
+    processed = 0
+
+    def emit(index: int, result: EvaluationData | None) -> None:
+        # In ordered mode a finished record waits until every earlier record is written.
+        nonlocal next_index
+        if not ordered:
+            if result is not None:
+                writer.write(result)
+            return
+        completed[index] = result
+        while next_index in completed:
+            result = completed.pop(next_index)
+            if result is not None:
+                writer.write(result)
+            next_index += 1
+
+    async def worker() -> None:
+        nonlocal processed
+        # Workers pull from a shared iterator, so records are only loaded when a slot frees up.
+        for index, answer in records:
+            try:
+                result = await run_agent(answer, memory_executor)
+            except Exception as e:
+                print(f"Error processing answer: {e}")
+                result = None
+            emit(index, result)
+            processed += 1
+            print(".", end="", flush=True)
+            if processed % 10 == 0:
+                print(f"\nProcessed {processed} records.\nStarted processing ", end="")
+
+    await chatbot_agent_pool.resize(max(1, concurrency))
+    # The default executor is capped at min(32, cpu_count + 4) threads, every worker gets its own thread for the blocking memory search.
+    memory_executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    await recall_tracker.start()
+    try:
+        await asyncio.gather(*[worker() for _ in range(max(1, concurrency))])
+    finally:
+        await recall_tracker.stop()
+        memory_executor.shutdown(wait=True)
+    print(f"\nRetrieval cache: {memory_store.get_stats()}")
+    print(f"Agent pool: {chatbot_agent_pool.get_stats()}")
+    return writer.count
+
+EXP_2_COLUMNS = ["question", "expected_answer", "session_id", "turn_id"]
+EXP_2_CACHE_VERSION = 1
+
+def load_data(file_path: str, limit: int = 10, type: str = "med_mcqa", cache: DatasetArtifactCache = None) -> list[EvaluationData]:
     if type == "med_mcqa":
-        dataset = MedMCQADataSet(file_path)
-        dataset.process_data(limit=limit)
-        data = dataset.get_data()
+        data = load_med_mcqa(file_path, limit=limit, cache=cache)
+        # Ids are derived from the MedMCQA record id, so a resumed run recognizes the records it already processed.
         return [EvaluationData(
             question=d["question"],
             expected_answer=d["expected_answer"],
-            session_id=str(uuid.uuid4()),
-            turn_id=str(uuid.uuid4()),
+            session_id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"med_mcqa/session/{d['id']}")),
+            turn_id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"med_mcqa/turn/{d['id']}")),
         ) for d in data]
     elif type == "exp_2":
-        dataset = pd.read_csv(file_path)
-        dataset = dataset[dataset["human_eval"] == "Incorrect"]
-        dataset = dataset.reset_index(drop=True)
-        evaluation_data = []
-        for i, row in dataset.iterrows():
-            if limit and i >= limit:
-                break
-            evaluation_data.append(EvaluationData(
-                question=row["question"],
-                expected_answer=row["expected_answer"],
-                session_id=row["session_id"],
-                turn_id=row["turn_id"],
-            ))
-        return evaluation_data
-
-def persist_experiment(answers: list[EvaluationData], file_path: str = ".evaluation_input_data"):
-    if not os.path.exists(file_path):
-        os.makedirs(file_path)
+        config = {"dataset": "exp_2", "version": EXP_2_CACHE_VERSION, "limit": limit, "human_eval": "Incorrect"}
+        compute = lambda: read_exp_2(file_path, limit=limit)
+        data = cache.get_or_compute(file_path, config, compute) if cache else compute()
+        return [EvaluationData(**d) for d in data]
+    return []
+
+def load_med_mcqa(file_path: str, limit: int = None, cache: DatasetArtifactCache = None) -> list[dict]:
+    compute = lambda: list(MedMCQADataSet(file_path).iter_processed_data(limit=limit))
+    if cache is None:
+        return compute()
+    if limit:
+        # Limited runs read the same leading records as a full run, so a cached full artifact serves them too.
+        data = cache.load(file_path, MedMCQADataSet.get_cache_config(limit=None), limit=limit)
+        if data is not None:
+            return data
+    return cache.get_or_compute(file_path, MedMCQADataSet.get_cache_config(limit=limit), compute)
+
+def read_exp_2(file_path: str, limit: int = None) -> list[dict]:
+    dataset = pd.read_csv(file_path, dtype={"session_id": str, "turn_id": str})
+    dataset = dataset.loc[dataset["human_eval"] == "Incorrect", EXP_2_COLUMNS]
+    if limit:
+        dataset = dataset.head(limit)
+    dataset = dataset.astype(object).where(dataset.notna(), None)
+    return dataset.to_dict(orient="records")
+
+def get_experiment_file(file_path: str = ".evaluation_input_data") -> str:
     unique_id =str(uuid.uuid4())
-    experiment_result_file = os.path.join(file_path, f"{unique_id}.jsonl")
-    with open(experiment_result_file, "w") as f:
-        for answer in answers:
-            f.write(json.dumps(answer.to_dict()))
-            f.write("\n")
-    print(f"\n\n**** Experiment results saved to - {experiment_result_file}")
+    return os.path.join(file_path, f"{unique_id}.jsonl")
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--file", type=str, required=True, help="Path to the file containing the answers.")
     parser.add_argument("--limit", type=int, help="Limit the number of records to read.", default=10)
     parser.add_argument("--type", type=str, default="med_mcqa", help="Type of dataset to read.", choices=["med_mcqa", "exp_2"])
+    parser.add_argument("--concurrency", type=int, default=1, help="Maximum number of records processed at the same time.")
+    parser.add_argument("--unordered", action="store_true", help="Write results in completion order instead of input order.")
+    parser.add_argument("--no_cache", action="store_true", help="Process the dataset from scratch instead of using the cached artifact.")
+    parser.add_argument("--resume", type=str, help="Results file of an interrupted run, records already in it are skipped.")
     args = parser.parse_args()
     file = args.file
     limit = args.limit
     type = args.type
-    answers = load_data(file_path=file, limit=limit, type=type)
+    dataset_cache = None if args.no_cache else DatasetArtifactCache(Constants.dataset_cache_path)
+    answers = load_data(file_path=file, limit=limit, type=type, cache=dataset_cache)
     print(f"Loaded {len(answers)} records from {file}.")
-    evaluation_results = []
+    experiment_result_file = args.resume or get_experiment_file()
+    if args.resume:
+        completed_turn_ids = ResultWriter.read_turn_ids(args.resume)
+        answers = [answer for answer in answers if answer.turn_id not in completed_turn_ids]
+        print(f"Resuming {args.resume}: {len(completed_turn_ids)} records done, {len(answers)} remaining.")
     print("Started processing ", end="")
-    for answer in answers:
+    with ResultWriter(experiment_result_file) as writer:
         try:
-            print(".", end="")
-            evaluation_results.append(asyncio.run(run_agent(answer)))
-            if len(evaluation_results) % 10 == 0:
-                print(f"\nProcessed {len(evaluation_results)} records.\nStarted processing ", end="")
-        except Exception as e:
-            print(f"Error processing answer: {e}")
-            continue
-    persist_experiment(answers=evaluation_results)
+            written = asyncio.run(run_agents(answers, writer=writer, concurrency=args.concurrency, ordered=not args.unordered))
+        except KeyboardInterrupt:
+            print(f"\n\n**** Interrupted, {writer.count} records saved. Continue with --resume {experiment_result_file}")
+            raise
+    print(f"\n\n**** Experiment results saved to - {experiment_result_file} ({written} records)")
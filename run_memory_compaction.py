@@ -0,0 +1,31 @@
+import os
+import json
+import asyncio
+from dotenv import load_dotenv
+from argparse import ArgumentParser
+
+from src.memory.base import MEMORY_TYPES
+from src.memory.factory import create_memory_store
+from src.service.memory_consolidator import MemoryConsolidator
+
+load_dotenv(override=True)
+
+async def run_compaction(types: list[str], threshold: float, user: str = None, agent: str = None, dry_run: bool = False) -> dict:
+    memory_store = create_memory_store()
+    memory_store.create_index(model=os.environ['AZURE_OPENAI_EMBEDDING_MODEL'])
+    consolidator = MemoryConsolidator(search_client=memory_store, similarity_threshold=threshold)
+    try:
+        return await consolidator.compact(types=types, user=user, agent=agent, dry_run=dry_run)
+    finally:
+        await memory_store.close()
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=0.95, help="Cosine similarity above which memories are merged.")
+    parser.add_argument("--types", type=str, nargs="+", default=MEMORY_TYPES, choices=MEMORY_TYPES, help="Memory types to compact.")
+    parser.add_argument("--user", type=str, help="Only compact memories of this user.")
+    parser.add_argument("--agent", type=str, help="Only compact memories of this agent.")
+    parser.add_argument("--dry_run", action="store_true", help="Report near-duplicates without changing the index.")
+    args = parser.parse_args()
+    report = asyncio.run(run_compaction(types=args.types, threshold=args.threshold, user=args.user, agent=args.agent, dry_run=args.dry_run))
+    print(json.dumps(report, indent=4))
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import asyncio
+from dotenv import load_dotenv
+from argparse import ArgumentParser
+
+from openai import AzureOpenAI
+from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+from autogen_agentchat.messages import TextMessage
+
+from src.memory.base import MemoryStore, MEMORY_TYPES
+from src.memory.bm25 import tokenize
+from src.memory.model import Memory
+from src.service.memory_builder import MemoryBuilder
+
+import warnings; warnings.simplefilter('ignore')
+
+load_dotenv(override=True)
+
+az_openai_model_client = AzureOpenAIChatCompletionClient(
+    azure_deployment=os.environ['AZURE_OPENAI_DEPLOYMENT_NAME'],
+    model=os.environ['AZURE_OPENAI_MODEL_NAME'],
+    api_version=os.environ['AZURE_OPENAI_API_VERSION'],
+    azure_endpoint=os.environ['AZURE_OPENAI_BASE_URL'],
+    api_key=os.environ['AZURE_OPENAI_API_KEY']
+)
+az_embedding_client = AzureOpenAI(
+    azure_endpoint=os.environ['AZURE_OPENAI_BASE_URL'],
+    api_key=os.environ['AZURE_OPENAI_API_KEY'],
+    api_version=os.environ['AZURE_OPENAI_EMBEDDING_API_VERSION'],
+)
+az_embedding_model = os.environ['AZURE_OPENAI_EMBEDDING_MODEL']
+
+def create_memory_builder(extraction_mode: str) -> MemoryBuilder:
+    # Memories are only extracted, never persisted, so no memory store is needed.
+    search_client: MemoryStore = None
+    return MemoryBuilder(
+        model_client=az_openai_model_client,
+        search_client=search_client,
+        embedding_client=az_embedding_client,
+        embedding_model=az_embedding_model,
+        extraction_mode=extraction_mode
+    )
+
+def load_conversations(file_path: str, limit: int = 10) -> list[list[TextMessage]]:
+    """
+    Build a question / answer / feedback conversation from every record of an experiment result file
+    """
+    conversations = []
+    with open(file_path, "r") as f:
+        for line in f:
+            if limit and len(conversations) >= limit:
+                break
+            record = json.loads(line)
+            conversation = [
+                TextMessage(content=record["question"], source="User"),
+                TextMessage(content=record["generated_answer"], source="Assistant"),
+            ]
+            if record.get("expected_answer"):
+                conversation.append(TextMessage(content=f"The correct answer is: {record['expected_answer']}", source="User"))
+            conversations.append(conversation)
+    return conversations
+
+def get_memory_tokens(memories: list[Memory]) -> set[str]:
+    return {token for memory in memories for token in tokenize(memory.memory)}
+
+def get_overlap(first: set[str], second: set[str]) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+async def run_mode(memory_builder: MemoryBuilder, conversations: list[list[TextMessage]]) -> tuple[list[list[Memory]], float]:
+    results = []
+    start = time.perf_counter()
+    for conversation in conversations:
+        results.append(await memory_builder.build_memory(conversation=conversation, user="comparison", agent="comparison"))
+    return results, time.perf_counter() - start
+
+async def run_comparison(conversations: list[list[TextMessage]], baseline_mode: str = "sequential") -> dict:
+    baseline_builder = create_memory_builder(baseline_mode)
+    fused_builder = create_memory_builder("fused")
+    baseline_results, baseline_seconds = await run_mode(baseline_builder, conversations)
+    fused_results, fused_seconds = await run_mode(fused_builder, conversations)
+
+    overlaps = {type: [] for type in MEMORY_TYPES}
+    counts = {mode: {type: 0 for type in MEMORY_TYPES} for mode in (baseline_mode, "fused")}
+    for baseline_memories, fused_memories in zip(baseline_results, fused_results):
+        for type in MEMORY_TYPES:
+            baseline_typed = [memory for memory in baseline_memories if memory.type == type]
+            fused_typed = [memory for memory in fused_memories if memory.type == type]
+            counts[baseline_mode][type] += len(baseline_typed)
+            counts["fused"][type] += len(fused_typed)
+            overlaps[type].append(get_overlap(get_memory_tokens(baseline_typed), get_memory_tokens(fused_typed)))
+
+    num_conversations = max(1, len(conversations))
+    report = {"conversations": len(conversations)}
+    for mode, builder, seconds in ((baseline_mode, baseline_builder, baseline_seconds), ("fused", fused_builder, fused_seconds)):
+        report[mode] = {
+            **builder.usage,
+            "total_tokens": builder.usage["prompt_tokens"] + builder.usage["completion_tokens"],
+            "seconds": round(seconds, 2),
+            "seconds_per_conversation": round(seconds / num_conversations, 2),
+            "memories": counts[mode],
+        }
+    report["token_overlap"] = {type: round(sum(values) / max(1, len(values)), 3) for type, values in overlaps.items()}
+    baseline_tokens = report[baseline_mode]["total_tokens"]
+    if baseline_tokens:
+        report["token_savings"] = round(1 - report["fused"]["total_tokens"] / baseline_tokens, 3)
+    return report
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--file", type=str, required=True, help="Path to an experiment result file (.jsonl).")
+    parser.add_argument("--limit", type=int, help="Limit the number of conversations to compare.", default=10)
+    parser.add_argument("--baseline", type=str, default="sequential", help="Extraction mode to compare against.", choices=["sequential", "concurrent"])
+    args = parser.parse_args()
+    conversations = load_conversations(file_path=args.file, limit=args.limit)
+    print(f"Loaded {len(conversations)} conversations from {args.file}.")
+    report = asyncio.run(run_comparison(conversations, baseline_mode=args.baseline))
+    print(json.dumps(report, indent=4))
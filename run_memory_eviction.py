@@ -0,0 +1,37 @@
+import os
+import json
+import asyncio
+from dotenv import load_dotenv
+from argparse import ArgumentParser
+
+from src.memory.base import MEMORY_TYPES
+from src.memory.factory import create_memory_store
+from src.service.memory_evictor import MemoryEvictor, EVICTION_POLICIES, EVICTION_SCOPES
+from src.utils.constants import Constants
+
+load_dotenv(override=True)
+
+async def run_eviction(types: list[str], max_memories: int, policy: str, scope: str, half_life_days: float,
+                       archive_path: str, dry_run: bool = False) -> dict:
+    memory_store = create_memory_store()
+    memory_store.create_index(model=os.environ['AZURE_OPENAI_EMBEDDING_MODEL'])
+    memory_evictor = MemoryEvictor(search_client=memory_store, max_memories=max_memories, policy=policy, scope=scope,
+                                   half_life_days=half_life_days, archive_path=archive_path)
+    try:
+        return await memory_evictor.evict(types=types, dry_run=dry_run)
+    finally:
+        await memory_store.close()
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--max_memories", type=int, required=True, help="Maximum memories of each type kept per scope.")
+    parser.add_argument("--policy", type=str, default="decay", choices=EVICTION_POLICIES, help="Which memories are evicted first.")
+    parser.add_argument("--scope", type=str, default="user", choices=EVICTION_SCOPES, help="Apply the cap per user or per agent.")
+    parser.add_argument("--half_life_days", type=float, default=30.0, help="Half-life of the decay policy.")
+    parser.add_argument("--types", type=str, nargs="+", default=MEMORY_TYPES, choices=MEMORY_TYPES, help="Memory types to evict from.")
+    parser.add_argument("--archive", type=str, default=Constants.memory_archive_path, help="JSONL file evicted memories are appended to.")
+    parser.add_argument("--dry_run", action="store_true", help="Report evictions without changing the index.")
+    args = parser.parse_args()
+    report = asyncio.run(run_eviction(types=args.types, max_memories=args.max_memories, policy=args.policy, scope=args.scope,
+                                      half_life_days=args.half_life_days, archive_path=args.archive, dry_run=args.dry_run))
+    print(json.dumps(report, indent=4))
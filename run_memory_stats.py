@@ -0,0 +1,20 @@
+import os
+import json
+from dotenv import load_dotenv
+from argparse import ArgumentParser
+
+from src.memory.factory import create_memory_store
+
+load_dotenv(override=True)
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--user", type=str, help="Only count memories of this user.")
+    parser.add_argument("--agent", type=str, help="Only count memories of this agent.")
+    args = parser.parse_args()
+    memory_store = create_memory_store()
+    memory_store.create_index(model=os.environ['AZURE_OPENAI_EMBEDDING_MODEL'])
+    stats = memory_store.get_memory_stats(user=args.user, agent=args.agent)
+    print(json.dumps(stats, indent=4))
+    if stats["truncated"]:
+        print("Warning: the per-user or per-agent counts are truncated, filter with --user or --agent for exact counts.")
@@ -1,8 +1,8 @@
 from typing import List, Any, Optional, Sequence, AsyncGenerator, Mapping
 from autogen_core import CancellationToken
-from autogen_core.models import ChatCompletionClient, UserMessage, AssistantMessage
+from autogen_core.models import ChatCompletionClient, UserMessage, AssistantMessage, CreateResult
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import AgentEvent, ChatMessage, TextMessage
+from autogen_agentchat.messages import AgentEvent, ChatMessage, TextMessage, ModelClientStreamingChunkEvent
 from autogen_agentchat.base import Response
 
 class MarkBaseAgent(AssistantAgent):
@@ -24,6 +24,12 @@ class MarkBaseAgent(AssistantAgent):
         )
         self._extra_create_args = extra_create_args
     
+    def get_context_stats(self) -> dict | None:
+        """
+        Token statistics of the last model call, when the model context reports them
+        """
+        return getattr(self._model_context, "last_stats", None)
+
     async def on_messages(self, messages: Sequence[ChatMessage], cancellation_token: CancellationToken) -> Response:
         async for message in self.on_messages_stream(messages, cancellation_token):
             if isinstance(message, Response):
@@ -42,9 +48,24 @@ class MarkBaseAgent(AssistantAgent):
 
         # Generate an inference result based on the current model context.
         llm_messages = self._system_messages + await self._model_context.get_messages()
-        result = await self._model_client.create(
-            llm_messages, tools=self._tools + self._handoff_tools, cancellation_token=cancellation_token, extra_create_args=self._extra_create_args
-        )
+        if self._model_client_stream:
+            # Stream the completion, the last chunk of a stream requested with include_usage carries the token usage.
+            result = None
+            extra_create_args = {**self._extra_create_args, "stream_options": {"include_usage": True}}
+            async for chunk in self._model_client.create_stream(
+                llm_messages, tools=self._tools + self._handoff_tools, cancellation_token=cancellation_token, extra_create_args=extra_create_args
+            ):
+                if isinstance(chunk, CreateResult):
+                    result = chunk
+                elif isinstance(chunk, str):
+                    yield ModelClientStreamingChunkEvent(content=chunk, source=self.name)
+                else:
+                    raise RuntimeError(f"Invalid chunk type: {type(chunk)}")
+            assert isinstance(result, CreateResult)
+        else:
+            result = await self._model_client.create(
+                llm_messages, tools=self._tools + self._handoff_tools, cancellation_token=cancellation_token, extra_create_args=self._extra_create_args
+            )
         response = result.content.strip()
 
         # Add the response to the model context.
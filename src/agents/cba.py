@@ -1,5 +1,6 @@
 from autogen_core.models import ChatCompletionClient
 from .base import MarkBaseAgent
+from .context import TokenBudgetChatCompletionContext
 
 class ChatbotAgent:
     name = "Assistant"
@@ -25,13 +26,16 @@ Memory Sources & Prioritization Order:
  - Helps maintain consistency in how the assistant interprets similar queries.
 """
 
-    def __init__(self, model_client: ChatCompletionClient, use_memory: bool = False):
+    def __init__(self, model_client: ChatCompletionClient, use_memory: bool = False, stream: bool = False,
+                 max_context_tokens: int = None):
         self.agent = MarkBaseAgent(
             name=self.name,
             description="Chatbot assistant",
             model_client=model_client,
             extra_create_args={"temperature": 0},
             system_message=self.agent_prompt if not use_memory else self.agent_prompt_with_memory,
+            model_client_stream=stream,
+            model_context=TokenBudgetChatCompletionContext(max_tokens=max_context_tokens) if max_context_tokens else None,
         )
     
     def get_agent(self) -> MarkBaseAgent:
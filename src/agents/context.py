@@ -0,0 +1,81 @@
+import re
+from typing import List
+
+import tiktoken
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import LLMMessage, UserMessage, FunctionExecutionResultMessage
+
+MEMORY_MARKER = "## Memories:"
+QUESTION_MARKER = "## Question:"
+# MarkBaseAgent replays the whole history as UserMessage, so a turn is recognized by the source of its question.
+USER_SOURCE = "User"
+# Approximate per-message overhead of the chat format (role and separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+MAX_MEMOIZED_MESSAGES = 4096
+
+
+class TokenBudgetChatCompletionContext(ChatCompletionContext):
+    """
+    Model context that fits the conversation into max_tokens. Memory blocks (starting at MEMORY_MARKER, up to
+    QUESTION_MARKER or the end of the message) are removed from every user message but the latest one, then the
+    oldest turns are dropped until the budget is met. The latest user message is always kept.
+    """
+    def __init__(self, max_tokens: int = 4000, encoding_name: str = "cl100k_base", initial_messages: List[LLMMessage] | None = None):
+        super().__init__(initial_messages)
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be greater than 0.")
+        self.max_tokens = max_tokens
+        self.tokenizer = tiktoken.get_encoding(encoding_name)
+        self.memory_pattern = re.compile(re.escape(MEMORY_MARKER) + r".*?(?=" + re.escape(QUESTION_MARKER) + r"|\Z)", re.DOTALL)
+        self.last_stats = {"original_tokens": 0, "tokens": 0, "saved_tokens": 0, "dropped_messages": 0}
+        # History is re-counted every turn (and replayed into reset agents), so counts are memoized by content.
+        self.token_counts: dict[str, int] = {}
+
+    async def get_messages(self) -> List[LLMMessage]:
+        messages = list(self._messages)
+        original_tokens = sum(self._count_tokens(message) for message in messages)
+        last_user = max((i for i, message in enumerate(messages) if self._is_turn_start(message)), default=-1)
+        messages = [
+            self._strip_memories(message) if i < last_user else message
+            for i, message in enumerate(messages)
+        ]
+        token_counts = [self._count_tokens(message) for message in messages]
+        total_tokens = sum(token_counts)
+        dropped = 0
+        # Whole turns are dropped, a turn starts at a user message, so the context never opens with an orphaned reply.
+        while total_tokens > self.max_tokens and dropped < last_user:
+            turn_end = dropped + 1
+            while turn_end < last_user and not self._is_turn_start(messages[turn_end]):
+                turn_end += 1
+            total_tokens -= sum(token_counts[dropped:turn_end])
+            dropped = turn_end
+        messages = messages[dropped:]
+        if messages and isinstance(messages[0], FunctionExecutionResultMessage):
+            messages = messages[1:]
+        self.last_stats = {
+            "original_tokens": original_tokens,
+            "tokens": total_tokens,
+            "saved_tokens": original_tokens - total_tokens,
+            "dropped_messages": dropped,
+        }
+        return messages
+
+    def _is_turn_start(self, message: LLMMessage) -> bool:
+        return isinstance(message, UserMessage) and message.source == USER_SOURCE
+
+    def _strip_memories(self, message: LLMMessage) -> LLMMessage:
+        if not isinstance(message, UserMessage) or not isinstance(message.content, str) or MEMORY_MARKER not in message.content:
+            return message
+        content = self.memory_pattern.sub("", message.content).strip()
+        return UserMessage(content=content, source=message.source)
+
+    def _count_tokens(self, message: LLMMessage) -> int:
+        content = message.content
+        if not isinstance(content, str):
+            content = str(content)
+        count = self.token_counts.get(content)
+        if count is None:
+            if len(self.token_counts) >= MAX_MEMOIZED_MESSAGES:
+                self.token_counts = {}
+            count = self.token_counts[content] = len(self.tokenizer.encode(content, disallowed_special=())) + MESSAGE_OVERHEAD_TOKENS
+        return count
@@ -0,0 +1,75 @@
+from autogen_core.models import ChatCompletionClient
+from .base import MarkBaseAgent
+
+FUSED_MEMORY_KEYS = ["residual_refined_memory", "user_question_refined_memory", "llm_response_refined_memory"]
+
+class FusedRefinedMemoryAgent:
+    name = "fused_refined_memory_agent"
+    agent_prompt = """You are an expert memory extraction agent. From one conversation between the User and the Assistant you extract three kinds of memory in a single pass.
+
+## Residual Memory (residual_refined_memory):
+- Capture facts or relationships that were indirectly communicated but not explicitly mentioned.
+- Extract context that the Assistant did not explicitly acknowledge or was unaware of.
+- Prioritize information that refines the Assistant’s understanding of terminology, accuracy, and user expectations.
+
+## User Question Memory (user_question_refined_memory):
+- Identify user-provided facts, abbreviations, and terminology that influence decision-making.
+- Retain domain-specific terms and the User's preferred phrasing.
+- Focus on details the Assistant was unaware of or didn’t previously have context about.
+
+## LLM Response Memory (llm_response_refined_memory):
+- Identify the factors in the Assistant’s response that led to the User’s acceptance, agreement, or decision-making.
+- Capture User preferences such as preferred formats, accuracy expectations, or domain-specific details.
+- Prioritize facts that will significantly impact future interactions rather than generic details.
+
+## Instructions:
+- Every memory must be concise, structured and directly applicable in future conversations.
+- Do not repeat the same memory across the three lists.
+- Return an empty list for a memory kind when the conversation holds nothing worth storing for it.
+
+## Example
+### Conversation:
+User: What is the concentration of tropicamide: a) 0.01 b) 0.02 c) 0.03 d) 0.04
+Assistant: Tropicamide is typically available in 0.5% and 1% solutions for ophthalmic use. None of the provided options match the commonly used concentrations.
+User: I believe the concentration used is 0.5%-1%, which translates to 0.005-0.01 in decimal form.
+Assistant: You're correct. The ophthalmic concentration of tropicamide is 0.5%-1%, which is equivalent to 0.005-0.01 in decimal form. The closest correct option is a) 0.01.
+
+### Extracted Memory:
+{{
+    "residual_refined_memory": [
+        "Tropicamide concentrations given as percentages (0.5%-1%) should be converted to decimals (0.005-0.01) when options are decimal."
+    ],
+    "user_question_refined_memory": [
+        "User expresses drug concentrations in decimal form, e.g. 0.5%-1% as 0.005-0.01."
+    ],
+    "llm_response_refined_memory": [
+        "User prefers definitive answers that select an option over broad explanations.",
+        "Acknowledging and refining earlier statements increases response acceptance."
+    ]
+}}
+"""
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "refined_memories",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {key: {"type": "array", "items": {"type": "string"}} for key in FUSED_MEMORY_KEYS},
+                "required": FUSED_MEMORY_KEYS,
+                "additionalProperties": False,
+            },
+        },
+    }
+
+    def __init__(self, model_client: ChatCompletionClient):
+        self.agent = MarkBaseAgent(
+            name=self.name,
+            description="A Fused Refined Memory Agent that extracts residual, user question and assistant response memories in one call.",
+            model_client=model_client,
+            extra_create_args={"temperature": 0, "response_format": self.response_format},
+            system_message=self.agent_prompt,
+        )
+
+    def get_agent(self) -> MarkBaseAgent:
+        return self.agent
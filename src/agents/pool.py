@@ -0,0 +1,81 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable, AsyncIterator
+
+from .base import MarkBaseAgent
+
+
+class AgentPool:
+    """
+    Pool of MarkBaseAgent instances built by factory. The pool grows lazily up to max_size agents,
+    callers beyond that wait for a release. Agents are reset on release, so every caller gets an empty model context.
+    """
+    def __init__(self, factory: Callable[[], MarkBaseAgent], max_size: int = 8, min_size: int = 0):
+        if max_size < 1:
+            raise ValueError(f"Invalid pool size: {max_size}")
+        self.factory = factory
+        self.max_size = max_size
+        self.idle: list[MarkBaseAgent] = [factory() for _ in range(min(min_size, max_size))]
+        self.size = len(self.idle)
+        self.condition = asyncio.Condition()
+        self.stats = {"acquired": 0, "created": self.size, "waited": 0}
+
+    async def acquire(self) -> MarkBaseAgent:
+        async with self.condition:
+            if not self.idle and self.size >= self.max_size:
+                self.stats["waited"] += 1
+                await self.condition.wait_for(lambda: self.idle or self.size < self.max_size)
+            self.stats["acquired"] += 1
+            if self.idle:
+                return self.idle.pop()
+            self.size += 1
+            self.stats["created"] += 1
+        try:
+            return self.factory()
+        except Exception:
+            await self._discard()
+            raise
+
+    async def release(self, agent: MarkBaseAgent) -> None:
+        try:
+            await agent.on_reset(cancellation_token=None)
+        except Exception as e:
+            print(f"Error resetting agent {agent.name}, discarding it: {e}")
+            await self._discard()
+            return
+        async with self.condition:
+            if self.size > self.max_size:
+                # The pool was shrunk while this agent was in use.
+                self.size -= 1
+            else:
+                self.idle.append(agent)
+            self.condition.notify()
+
+    @asynccontextmanager
+    async def agent(self) -> AsyncIterator[MarkBaseAgent]:
+        agent = await self.acquire()
+        try:
+            yield agent
+        finally:
+            await self.release(agent)
+
+    async def resize(self, max_size: int) -> None:
+        """
+        Change the maximum number of agents, idle agents above a smaller size are dropped right away
+        """
+        if max_size < 1:
+            raise ValueError(f"Invalid pool size: {max_size}")
+        async with self.condition:
+            self.max_size = max_size
+            while self.size > max_size and self.idle:
+                self.idle.pop()
+                self.size -= 1
+            self.condition.notify_all()
+
+    async def _discard(self) -> None:
+        async with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "size": self.size, "idle": len(self.idle)}
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Callable
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+HASH_INDEX_FILE_NAME = "file_hashes.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+# Small row groups let a limited load decode only the leading rows of an artifact.
+ROW_GROUP_SIZE = 4096
+
+
+class DatasetArtifactCache:
+    """
+    On-disk cache of processed datasets stored as Parquet files, keyed by sha256 of the source file and the
+    processing config. Source file hashes are memoized by (size, mtime), so an unchanged file is not re-read,
+    and artifacts are memory-mapped on load.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "hashed_files": 0}
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.hash_index_path = os.path.join(directory, HASH_INDEX_FILE_NAME)
+        self.file_hashes = self._read_hash_index()
+
+    def get_file_hash(self, file_path: str) -> str:
+        """
+        sha256 of the file content, recomputed only when the file size or modification time changed
+        """
+        path = os.path.realpath(file_path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.file_hashes.get(path)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                return entry["hash"]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        with self.lock:
+            self.file_hashes[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest.hexdigest()}
+            self.stats["hashed_files"] += 1
+            self._write_hash_index()
+        return digest.hexdigest()
+
+    def get_key(self, file_path: str, config: dict) -> str:
+        payload = json.dumps({"file": self.get_file_hash(file_path), "config": config}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load(self, file_path: str, config: dict, limit: int = None) -> list[dict] | None:
+        """
+        Cached records for (file_path, config), only the first limit records are decoded when limit is set
+        """
+        artifact_path = self._get_artifact_path(self.get_key(file_path, config))
+        if not os.path.exists(artifact_path):
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        if limit:
+            parquet_file = pq.ParquetFile(artifact_path, memory_map=True)
+            limit = min(limit, parquet_file.metadata.num_rows)
+            batches = []
+            rows = 0
+            for batch in parquet_file.iter_batches(batch_size=max(1, min(limit, ROW_GROUP_SIZE))):
+                batches.append(batch)
+                rows += batch.num_rows
+                if rows >= limit:
+                    break
+            table = pa.Table.from_batches(batches, schema=parquet_file.schema_arrow).slice(0, limit)
+        else:
+            table = pq.read_table(artifact_path, memory_map=True)
+        with self.lock:
+            self.stats["hits"] += 1
+        return table.to_pylist()
+
+    def save(self, file_path: str, config: dict, records: list[dict]) -> str:
+        artifact_path = self._get_artifact_path(self.get_key(file_path, config))
+        # Written under a temporary name and renamed, so a concurrent or interrupted run never loads a partial artifact.
+        temp_path = f"{artifact_path}.{os.getpid()}.tmp"
+        pq.write_table(pa.Table.from_pylist(records), temp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temp_path, artifact_path)
+        return artifact_path
+
+    def get_or_compute(self, file_path: str, config: dict, compute: Callable[[], list[dict]]) -> list[dict]:
+        """
+        Return the cached records for (file_path, config), calling compute() and caching its result on a miss
+        """
+        records = self.load(file_path, config)
+        if records is None:
+            records = compute()
+            self.save(file_path, config, records)
+        return records
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+    def _get_artifact_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def _read_hash_index(self) -> dict:
+        if not os.path.exists(self.hash_index_path):
+            return {}
+        try:
+            with open(self.hash_index_path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_hash_index(self) -> None:
+        temp_path = f"{self.hash_index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.file_hashes, f)
+        os.replace(temp_path, self.hash_index_path)
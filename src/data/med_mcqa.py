@@ -1,45 +1,107 @@
 import json
 import pandas as pd
 import tiktoken
+from typing import Iterator
 
 from .base import Dataset
 
+# Expected answers longer than this many tokens are removed when cleaning.
+MAX_EXPECTED_ANSWER_TOKENS = 32
+ENCODING_NAME = tiktoken.encoding_name_for_model("gpt-3.5")
+# Bump when the processed record format changes, so cached dataset artifacts are rebuilt.
+PROCESSING_VERSION = 2
+
 class MedMCQADataSet(Dataset):
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, batch_size: int = 1024, num_threads: int = 8):
         self.file_path = file_path
         self.clean_data = True
-        self.tokenizer = tiktoken.get_encoding(tiktoken.encoding_name_for_model("gpt-3.5"))
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.tokenizer = tiktoken.get_encoding(ENCODING_NAME)
         super().__init__("MedMCQADataSet")
 
     def read_data(self, limit: int = None):
-        data = []
+        self.data = pd.DataFrame(list(self.iter_records(limit=limit)))
+
+    def iter_records(self, limit: int = None) -> Iterator[dict]:
+        """
+        Stream records from the file, applying the cleaning filters record by record when clean_data is set.
+        Stops reading as soon as limit records were produced.
+        """
+        produced = 0
+        candidates = []
         with open(self.file_path, "r") as f:
-            for line in f:
-                data.append(json.loads(line))
-        if limit:
-            data = data[:limit]
-        self.data = pd.DataFrame(data)
+            for line_number, line in enumerate(f):
+                if limit and produced >= limit:
+                    return
+                record = json.loads(line)
+                # MedMCQA question stems repeat, so records are identified by their id (or line) rather than the text.
+                if not record.get("id"):
+                    record["id"] = f"line-{line_number}"
+                if not self.clean_data:
+                    produced += 1
+                    yield record
+                    continue
+                # Remove rows where none of the options are correct
+                if pd.isna(record.get("exp")):
+                    continue
+                # Remove rows where the question contains reasoning keyword "what"
+                if "what " in record["question"].lower():
+                    continue
+                candidates.append(record)
+                # With a limit, batches shrink to what is still needed, so no record past the last one is tokenized.
+                batch_size = min(self.batch_size, limit - produced) if limit else self.batch_size
+                if len(candidates) >= batch_size:
+                    for record in self._filter_by_token_count(candidates):
+                        if limit and produced >= limit:
+                            return
+                        produced += 1
+                        yield record
+                    candidates = []
+        for record in self._filter_by_token_count(candidates):
+            if limit and produced >= limit:
+                return
+            produced += 1
+            yield record
+
+    def iter_processed_data(self, limit: int = None) -> Iterator[dict]:
+        """
+        Stream processed records (question with its options, expected answer)
+        """
+        for record in self.iter_records(limit=limit):
+            yield self._process_record(record)
 
     def process_data(self, **kwargs):
         """
         Process the data to create the required columns
         """
         if self.data is None:
-            if kwargs.get("limit") and not self.clean_data:
-                self.read_data(limit=kwargs["limit"])
-            else:
-                self.read_data()
-        if self.clean_data:
-            # Remove rows where none of the options are correct
-            self.data = self.data[self.data["exp"].notnull()]
-            # Remove rows where the question contains reasoning keyword "what"
-            self.data = self.data[~self.data["question"].str.contains("what ", case=False)]
-            # Remove rows where the expected answer token count is greater than 32
-            self.data = self.data[self.data["exp"].apply(lambda x: len(self.tokenizer.encode(x)) <= 32)]
-            if kwargs.get("limit"):
-                self.data = self.data.head(kwargs["limit"])
-        self.data["options"] = self.data.apply(lambda x: "\n".join([f"{chr(97 + i)}) {x[f'op{chr(97 + i)}']}" for i in range(4)]), axis=1)
-        intermediate_data = self.data[["question", "options", "exp"]].copy()
-        intermediate_data.loc[:, "expected_answer"] = intermediate_data["exp"]
-        intermediate_data.loc[:, "question"] = intermediate_data["question"] + "\n" + intermediate_data["options"]
-        self.processed_data = intermediate_data[["question", "expected_answer"]].to_dict(orient="records")
+            self.read_data(limit=kwargs.get("limit"))
+        elif kwargs.get("limit"):
+            self.data = self.data.head(kwargs["limit"])
+        self.processed_data = [self._process_record(record) for record in self.data.to_dict(orient="records")]
+
+    @staticmethod
+    def get_cache_config(limit: int = None, clean_data: bool = True) -> dict:
+        """
+        Everything that determines the processed records besides the file content, used as the artifact cache key
+        """
+        config = {"dataset": "med_mcqa", "version": PROCESSING_VERSION, "limit": limit, "clean_data": clean_data}
+        if clean_data:
+            config.update({"encoding": ENCODING_NAME, "max_expected_answer_tokens": MAX_EXPECTED_ANSWER_TOKENS})
+        return config
+
+    def _filter_by_token_count(self, records: list[dict]) -> list[dict]:
+        # Remove rows where the expected answer token count is greater than 32
+        if not records:
+            return []
+        token_lists = self.tokenizer.encode_batch([record["exp"] for record in records], num_threads=self.num_threads)
+        return [record for record, tokens in zip(records, token_lists) if len(tokens) <= MAX_EXPECTED_ANSWER_TOKENS]
+
+    def _process_record(self, record: dict) -> dict:
+        options = "\n".join([f"{chr(97 + i)}) {record[f'op{chr(97 + i)}']}" for i in range(4)])
+        return {
+            "id": record["id"],
+            "question": record["question"] + "\n" + options,
+            "expected_answer": record["exp"],
+        }
@@ -0,0 +1,64 @@
+import os
+import json
+
+from .model import EvaluationData
+
+
+class ResultWriter:
+    """
+    Appends EvaluationData records to a JSONL file, flushing after every record so an interrupted run keeps
+    everything it finished. Opening an existing file appends to it, which is how runs are resumed.
+    """
+    def __init__(self, file_path: str, fsync: bool = False):
+        self.file_path = file_path
+        self.fsync = fsync
+        self.count = 0
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        needs_newline = os.path.exists(file_path) and os.path.getsize(file_path) > 0 and not self._ends_with_newline(file_path)
+        self.file = open(file_path, "a")
+        if needs_newline:
+            # The previous run stopped in the middle of a line, that partial record is ignored by read_turn_ids.
+            self.file.write("\n")
+
+    def write(self, record: EvaluationData) -> None:
+        self.file.write(json.dumps(record.to_dict()))
+        self.file.write("\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def read_turn_ids(file_path: str) -> set[str]:
+        """
+        turn_ids of the complete records in a results file, an unreadable (partially written) line is skipped
+        """
+        turn_ids = set()
+        if not os.path.exists(file_path):
+            return turn_ids
+        with open(file_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("turn_id"):
+                    turn_ids.add(record["turn_id"])
+        return turn_ids
+
+    def _ends_with_newline(self, file_path: str) -> bool:
+        with open(file_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
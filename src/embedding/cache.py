@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """
+    Two tier embedding cache keyed by (model, dimensions, sha256(text)).
+    The in-process tier is an LRU dictionary bounded by entries and bytes, the on-disk tier is a SQLite table.
+    Both tiers hold float32 blobs (about 6 KB for 1536 dimensions), vectors are converted to lists on read.
+    """
+    def __init__(self, path: str = None, max_entries: int = 50000, max_memory_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_bytes = 0
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.connection = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS embeddings (
+                                        "key" TEXT PRIMARY KEY,
+                                        "vector" BLOB NOT NULL
+                                    );""")
+            self.connection.commit()
+
+    @staticmethod
+    def get_key(model: str, text: str, dimensions: int = None) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions or 0}:{text_hash}"
+
+    def get(self, model: str, text: str, dimensions: int = None) -> list[float] | None:
+        return self.get_many(model, [text], dimensions)[0]
+
+    def get_many(self, model: str, texts: list[str], dimensions: int = None) -> list[list[float] | None]:
+        keys = [self.get_key(model, text, dimensions) for text in texts]
+        vectors = []
+        with self.lock:
+            for key in keys:
+                vector = None
+                blob = self.entries.get(key)
+                if blob is not None:
+                    self.entries.move_to_end(key)
+                    vector = array("f", blob).tolist()
+                    self.stats["memory_hits"] += 1
+                elif self.connection is not None:
+                    row = self.connection.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        vector = array("f", row[0]).tolist()
+                        self._remember(key, row[0])
+                        self.stats["disk_hits"] += 1
+                if vector is None:
+                    self.stats["misses"] += 1
+                vectors.append(vector)
+        return vectors
+
+    def set(self, model: str, text: str, vector: list[float], dimensions: int = None) -> None:
+        self.set_many(model, [text], [vector], dimensions)
+
+    def set_many(self, model: str, texts: list[str], vectors: list[list[float]], dimensions: int = None) -> None:
+        rows = []
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                key = self.get_key(model, text, dimensions)
+                blob = array("f", vector).tobytes()
+                self._remember(key, blob)
+                rows.append((key, blob))
+            if self.connection is not None and rows:
+                self.connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self.connection.commit()
+
+    def get_or_compute(self, model: str, texts: list[str], compute, dimensions: int = None) -> list[list[float]]:
+        """
+        Return vectors for texts, calling compute(missing_texts) -> list of vectors only for cache misses
+        """
+        vectors = self.get_many(model, texts, dimensions)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, compute(missing)))
+            self.set_many(model, list(computed.keys()), list(computed.values()), dimensions)
+            vectors = [vector if vector is not None else computed[text] for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def get_stats(self) -> dict[str, float]:
+        with self.lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            total = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "hits": hits,
+                "hit_rate": hits / total if total else 0.0,
+                "memory_entries": len(self.entries),
+                "memory_bytes": self.memory_bytes,
+            }
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _remember(self, key: str, blob: bytes) -> None:
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous)
+        self.entries[key] = blob
+        self.memory_bytes += len(blob)
+        while self.entries and (len(self.entries) > self.max_entries or self.memory_bytes > self.max_memory_bytes):
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_bytes -= len(evicted)
@@ -0,0 +1,170 @@
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import tiktoken
+from openai import AzureOpenAI
+
+from .cache import EmbeddingCache
+
+
+class EmbeddingService:
+    """
+    Collects single-text embedding requests from any thread or coroutine and sends them
+    as batched embeddings.create(input=[...]) calls. Each caller gets back its own vector.
+    """
+    def __init__(self, embedding_client: AzureOpenAI, model: str, embedding_cache: EmbeddingCache = None,
+                 max_batch_size: int = 64, max_wait_ms: float = 10.0, max_batch_tokens: int = 32000,
+                 max_concurrent_requests: int = 4, encoding_name: str = "cl100k_base"):
+        self.embedding_client = embedding_client
+        self.model = model
+        self.embedding_cache = embedding_cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_tokens = max_batch_tokens
+        self.tokenizer = tiktoken.get_encoding(encoding_name)
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_requests)
+        self.worker = None
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "texts_sent": 0, "api_calls": 0}
+        self.in_flight = 0
+
+    def embed(self, text: str) -> list[float]:
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        if self.embedding_cache is None:
+            return self._embed_uncached(texts)
+        return self.embedding_cache.get_or_compute(self.model, texts, self._embed_uncached)
+
+    async def aembed(self, text: str) -> list[float]:
+        if self.embedding_cache is not None:
+            vector = self.embedding_cache.get(self.model, text)
+            if vector is not None:
+                return vector
+        vector = await asyncio.wrap_future(self._submit(text))
+        if self.embedding_cache is not None:
+            self.embedding_cache.set(self.model, text, vector)
+        return vector
+
+    def get_stats(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self) -> None:
+        if self.worker is not None:
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _embed_uncached(self, texts: list[str]) -> list[list[float]]:
+        futures = self._submit_many(texts)
+        return [future.result() for future in futures]
+
+    def _submit(self, text: str) -> Future:
+        return self._submit_many([text])[0]
+
+    def _submit_many(self, texts: list[str]) -> list[Future]:
+        # The texts of one call are queued as a single item, so the worker never sees only part of them.
+        items = [(text, Future()) for text in texts]
+        if not items:
+            return []
+        with self.lock:
+            self.stats["requests"] += len(items)
+            # A worker that died would leave every later request waiting, so a new one is started.
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+        self.queue.put(items)
+        return [future for _, future in items]
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = list(item)
+            # A lone request with no call in flight is not part of a burst, waiting for company would only add latency.
+            with self.lock:
+                idle = self.in_flight == 0
+            deadline = time.monotonic() + (0 if idle and self.queue.empty() else self.max_wait)
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.extend(item)
+            try:
+                for chunk in self._split_by_tokens(batch):
+                    with self.lock:
+                        self.in_flight += 1
+                    try:
+                        self.executor.submit(self._dispatch, chunk)
+                    except Exception:
+                        with self.lock:
+                            self.in_flight -= 1
+                        raise
+            except Exception as e:
+                # Callers wait on their futures without a timeout, every request of the batch must be resolved.
+                self._fail(batch, e)
+            if stop:
+                return
+
+    def _split_by_tokens(self, batch: list[tuple[str, Future]]) -> list[list[tuple[str, Future]]]:
+        chunks = []
+        chunk = []
+        chunk_tokens = 0
+        for text, future in batch:
+            tokens = len(self.tokenizer.encode(text, disallowed_special=()))
+            if chunk and (chunk_tokens + tokens > self.max_batch_tokens or len(chunk) >= self.max_batch_size):
+                chunks.append(chunk)
+                chunk = []
+                chunk_tokens = 0
+            chunk.append((text, future))
+            chunk_tokens += tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _dispatch(self, chunk: list[tuple[str, Future]]) -> None:
+        try:
+            self._send(chunk)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _send(self, chunk: list[tuple[str, Future]]) -> None:
+        # Identical texts in the same batch are sent once and fanned out to every waiting caller.
+        unique_texts = list(dict.fromkeys(text for text, _ in chunk))
+        try:
+            response = self.embedding_client.embeddings.create(input=unique_texts, model=self.model)
+            vectors = {unique_texts[item.index]: item.embedding for item in response.data}
+            with self.lock:
+                self.stats["api_calls"] += 1
+                self.stats["texts_sent"] += len(unique_texts)
+            for text, future in chunk:
+                future.set_result(vectors[text])
+        except Exception as e:
+            self._fail(chunk, e)
+
+    def _fail(self, items: list[tuple[str, Future]], error: Exception) -> None:
+        for _, future in items:
+            if not future.done():
+                future.set_exception(error)
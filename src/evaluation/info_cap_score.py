@@ -1,7 +1,14 @@
+from typing import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
 from .base import EvaluationMetric
 from .info_cov_score import InformationCoverageScore
 from .key_point_cov_score import KeyPointCoverageScore
 from src.data.model import EvaluationData
+from src.embedding.service import EmbeddingService
+from src.utils.retry import retry_with_backoff
 
 class InformationCaptureScore(EvaluationMetric):
     def __init__(self):
@@ -15,44 +22,91 @@ class InformationCaptureScore(EvaluationMetric):
         }
         self.info_cov_score = 0.0
         self.key_point_cov_score = 0.0
+        self.totals = {"answers": 0, "key_point_cov_score": 0.0, "info_cov_score": 0.0}
     
     def set_weights(self, key_point_cov_score_weight: float, info_cov_score_weight: float):
         self.weights["key_point_cov_score"] = key_point_cov_score_weight
         self.weights["info_cov_score"] = info_cov_score_weight
     
     def evaluate(self, **kwargs) -> list[EvaluationData]:
-        answers : list[EvaluationData] = kwargs.get("answers")
-        openai_client = kwargs.get("openai_client")
-        embedding_client = kwargs.get("embedding_client")
-        openai_model = kwargs.get("openai_model")
-        embeddings_model = kwargs.get("embedding_model")
-        key_point_cs_threshold = kwargs.get("key_point_cs_threshold")
-        info_cov_cs_threshold = kwargs.get("info_cov_cs_threshold")
-        
-        if not answers or not openai_client or not embedding_client or not openai_model or not embeddings_model:
+        # Checked before _get_arguments, which may create an EmbeddingService that only _close shuts down.
+        if not kwargs.get("answers"):
             raise ValueError("Answers, OpenAI client, embedding client, OpenAI model, and embeddings model are required.")
-        
-        if not key_point_cs_threshold:
-            key_point_cs_threshold = 0.9
-        if not info_cov_cs_threshold:
-            info_cov_cs_threshold = 0.9
-        
-        answers_with_scores = self.key_point_cov_score_client.evaluate(
-            answers=answers,
-            openai_client=openai_client,
-            embedding_client=embedding_client,
-            openai_model=openai_model,
-            embedding_model=embeddings_model,
-            cosine_similarity_threshold=key_point_cs_threshold
-        )
+        arguments = self._get_arguments(**kwargs)
+        try:
+            self._prepare(arguments)
+            return self._evaluate_prepared(kwargs.get("answers"), arguments)
+        finally:
+            self._close(arguments, kwargs)
+
+    def evaluate_chunks(self, chunks: Iterable[list[EvaluationData]], **kwargs) -> Iterator[list[EvaluationData]]:
+        """
+        Score the answers one chunk at a time (same arguments as evaluate), yielding every scored chunk.
+        The scores are running averages over all chunks yielded so far, so they match a single evaluate call.
+        """
+        arguments = self._get_arguments(**kwargs)
+        # Prepared once, so key point vectors and embedding statistics are kept across chunks.
+        self.totals = {"answers": 0, "key_point_cov_score": 0.0, "info_cov_score": 0.0}
+        try:
+            self._prepare(arguments)
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                answers_with_scores = self._evaluate_prepared(chunk, arguments)
+                self.totals["answers"] += len(answers_with_scores)
+                self.totals["key_point_cov_score"] += sum(answer.kp_cov_cs_score for answer in answers_with_scores)
+                self.totals["info_cov_score"] += sum(answer.in_cov_cs_score for answer in answers_with_scores)
+                self.key_point_cov_score = self.totals["key_point_cov_score"] / self.totals["answers"]
+                self.info_cov_score = self.totals["info_cov_score"] / self.totals["answers"]
+                self.set_score((self.weights["key_point_cov_score"] * self.key_point_cov_score) + (self.weights["info_cov_score"] * self.info_cov_score))
+                yield answers_with_scores
+        finally:
+            self._close(arguments, kwargs)
+
+    def _get_arguments(self, **kwargs) -> dict:
+        arguments = {
+            "openai_client": kwargs.get("openai_client"),
+            "embedding_client": kwargs.get("embedding_client"),
+            "openai_model": kwargs.get("openai_model"),
+            "embedding_model": kwargs.get("embedding_model"),
+            "key_point_cs_threshold": kwargs.get("key_point_cs_threshold") or 0.9,
+            "info_cov_cs_threshold": kwargs.get("info_cov_cs_threshold") or 0.9,
+            "embedding_service": kwargs.get("embedding_service"),
+            "key_point_cache": kwargs.get("key_point_cache"),
+            "concurrency": kwargs.get("concurrency") or 1,
+        }
+        if not arguments["openai_client"] or not arguments["embedding_client"] or not arguments["openai_model"] or not arguments["embedding_model"]:
+            raise ValueError("Answers, OpenAI client, embedding client, OpenAI model, and embeddings model are required.")
+        if arguments["embedding_service"] is None:
+            arguments["embedding_service"] = EmbeddingService(embedding_client=arguments["embedding_client"], model=arguments["embedding_model"],
+                                                              embedding_cache=kwargs.get("embedding_cache"))
+        return arguments
+
+    def _prepare(self, arguments: dict) -> None:
+        self.key_point_cov_score_client.prepare(embedding_client=arguments["embedding_client"], embedding_model=arguments["embedding_model"],
+                                                embedding_service=arguments["embedding_service"], key_point_cache=arguments["key_point_cache"])
+
+    def _close(self, arguments: dict, kwargs: dict) -> None:
+        # Only a service built by _get_arguments is closed, a caller's service is shared beyond this run.
+        if kwargs.get("embedding_service") is None:
+            arguments["embedding_service"].close()
+
+    def _evaluate_prepared(self, answers: list[EvaluationData], arguments: dict) -> list[EvaluationData]:
+        if arguments["concurrency"] > 1:
+            answers_with_scores = self._evaluate_concurrently(answers=answers, **arguments)
+        else:
+            for answer in answers:
+                self.key_point_cov_score_client.score_answer(answer, arguments["openai_client"], arguments["openai_model"],
+                                                             arguments["key_point_cs_threshold"])
+            self.key_point_cov_score_client.summarize(answers)
+            answers_with_scores = self.info_cov_score_client.evaluate(
+                answers=answers,
+                cosine_similarity_threshold=arguments["info_cov_cs_threshold"],
+                embedding_client=arguments["embedding_client"],
+                model=arguments["embedding_model"],
+                embedding_service=arguments["embedding_service"]
+            )
         self.key_point_cov_score = self.key_point_cov_score_client.score
-        
-        answers_with_scores = self.info_cov_score_client.evaluate(
-            answers=answers_with_scores,
-            cosine_similarity_threshold=info_cov_cs_threshold,
-            embedding_client=embedding_client,
-            model=embeddings_model
-        )
         self.info_cov_score = self.info_cov_score_client.score
         score = (self.weights["key_point_cov_score"] * self.key_point_cov_score) + (self.weights["info_cov_score"] * self.info_cov_score)
         self.set_score(score)
@@ -63,6 +117,29 @@ class InformationCaptureScore(EvaluationMetric):
         print(f"Information Capture Score: {score} from {len(answers)} answers")
         return answers_with_scores
 
+    def _evaluate_concurrently(self, answers: list[EvaluationData], openai_client, embedding_client, openai_model: str,
+                               embedding_model: str, key_point_cs_threshold: float, info_cov_cs_threshold: float,
+                               embedding_service: EmbeddingService, key_point_cache, concurrency: int) -> list[EvaluationData]:
+        # Both sub-metrics of every answer are scheduled on one pool, the pool size bounds the in-flight OpenAI calls.
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = []
+            for answer in answers:
+                futures.append(executor.submit(retry_with_backoff, self.key_point_cov_score_client.score_answer,
+                                               answer, openai_client, openai_model, key_point_cs_threshold,
+                                               should_retry=self._is_retryable))
+                futures.append(executor.submit(retry_with_backoff, self.info_cov_score_client.score_answer,
+                                               answer, info_cov_cs_threshold, embedding_service,
+                                               should_retry=self._is_retryable))
+            for future in futures:
+                future.result()
+        self.key_point_cov_score_client.summarize(answers)
+        self.info_cov_score_client.summarize(answers)
+        return answers
+
+    @staticmethod
+    def _is_retryable(e: Exception) -> bool:
+        return isinstance(e, (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError))
+
     def get_score(self):
         return {
             "key_point_cov_score": self.key_point_cov_score,
@@ -1,54 +1,92 @@
 import re
 import numpy as np
-from openai import AzureOpenAI
 
 from .base import EvaluationMetric
 from src.data.model import EvaluationData
+from src.embedding.service import EmbeddingService
 
 class InformationCoverageScore(EvaluationMetric):
     def __init__(self):
         super().__init__("InformationCoverageScore")
     
     def evaluate(self, **kwargs) -> list[EvaluationData]:
-        score = 0.0
         answers_with_scores = []
         answers : list[EvaluationData] = kwargs.get("answers")
         cosine_similarity_threshold = kwargs.get("cosine_similarity_threshold")
         embedding_client = kwargs.get("embedding_client")
         model = kwargs.get("model")
+        embedding_cache = kwargs.get("embedding_cache")
+        embedding_service = kwargs.get("embedding_service")
         if not answers or not cosine_similarity_threshold or not embedding_client or not model:
             raise ValueError("Answers, cosine similarity threshold, embedding client, and model are required.")
-        for answer in answers:
-            similarity_scores = []
-            info_coverage_scores = []
-            generated = answer.generated_answer
-            expected = answer.expected_answer
-            if generated and expected:
-                generated_sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z0-9])', generated)
-                expected_sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z0-9])', expected)
-                generated_vectors = self._convert_string_to_vector(generated_sentences, embedding_client, model)
-                expected_vectors = self._convert_string_to_vector(expected_sentences, embedding_client, model)
-                similarity_scores = [[float(self._calculate_cosine_similarity(generated_vector, expected_vector)) for expected_vector in expected_vectors] for generated_vector in generated_vectors]
-                for i in range(len(similarity_scores)):
-                    x = [sim for sim in similarity_scores[i] if sim >= np.quantile(similarity_scores[i], cosine_similarity_threshold)]
-                    info_coverage_scores.append(len(x))
-                info_coverage_score = float(np.mean([i / len(expected_sentences) for i in info_coverage_scores]))
-            else: 
-                info_coverage_score = 0.0
-            answer.set_in_cov_cs_score(info_coverage_score)
-            answers_with_scores.append(answer)
+        owned_embedding_service = None
+        if embedding_service is None:
+            embedding_service = owned_embedding_service = EmbeddingService(embedding_client=embedding_client, model=model, embedding_cache=embedding_cache)
+        batch_size = kwargs.get("batch_size") or 32
+        try:
+            for start in range(0, len(answers), batch_size):
+                batch = answers[start:start + batch_size]
+                self._score_batch(batch, cosine_similarity_threshold, embedding_service)
+                answers_with_scores.extend(batch)
+        finally:
+            if owned_embedding_service is not None:
+                owned_embedding_service.close()
+        self.summarize(answers)
+        return answers_with_scores
+    
+    def summarize(self, answers: list[EvaluationData]) -> float:
+        score = 0.0
         if answers:
             score = sum([answer.in_cov_cs_score for answer in answers]) / len(answers)
         self.set_score(score)
         print(f"Information Coverage Score: {score} from {len(answers)} answers.")
-        return answers_with_scores
+        return score
+    
+    def score_answer(self, answer: EvaluationData, cosine_similarity_threshold: float, embedding_service: EmbeddingService) -> float:
+        self._score_batch([answer], cosine_similarity_threshold, embedding_service)
+        return answer.in_cov_cs_score
+    
+    def _score_batch(self, answers: list[EvaluationData], cosine_similarity_threshold: float, embedding_service: EmbeddingService) -> None:
+        # Sentences of every answer in the batch are embedded together and normalized once,
+        # each answer then scores against its own slice of the matrix.
+        sentence_pairs = []
+        for answer in answers:
+            if answer.generated_answer and answer.expected_answer:
+                sentence_pairs.append((self._split_sentences(answer.generated_answer), self._split_sentences(answer.expected_answer)))
+            else:
+                sentence_pairs.append(None)
+        sentences = [sentence for pair in sentence_pairs if pair for part in pair for sentence in part]
+        vectors = self._normalize(self._convert_string_to_vector(sentences, embedding_service)) if sentences else None
+        offset = 0
+        for answer, pair in zip(answers, sentence_pairs):
+            if pair is None:
+                answer.set_in_cov_cs_score(0.0)
+                continue
+            generated_sentences, expected_sentences = pair
+            generated_vectors = vectors[offset:offset + len(generated_sentences)]
+            offset += len(generated_sentences)
+            expected_vectors = vectors[offset:offset + len(expected_sentences)]
+            offset += len(expected_sentences)
+            answer.set_in_cov_cs_score(self._calculate_coverage(generated_vectors, expected_vectors, cosine_similarity_threshold))
+    
+    def _split_sentences(self, text: str) -> list[str]:
+        return re.split(r'(?<=[.!?])\s+(?=[A-Z0-9])', text)
+    
+    def _convert_string_to_vector(self, sentences: list[str], embedding_service: EmbeddingService) -> list[list[float]]:
+        return embedding_service.embed_many(sentences)
     
-    def _convert_string_to_vector(self, sentences: list[str], embedding_client: AzureOpenAI, model: str) -> list[float]:
-        return [embedding_client.embeddings.create(input=sentence, model=model).data[0].embedding for sentence in sentences]
+    def _normalize(self, vectors: list[list[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
     
-    def _calculate_cosine_similarity(self, generated: list[float], expected: list[float]) -> float:
-        dot_product = sum([a * b for a, b in zip(generated, expected)])
-        magnitude_generated = sum([a ** 2 for a in generated]) ** 0.5
-        magnitude_expected = sum([b ** 2 for b in expected]) ** 0.5
-        similarity = dot_product / (magnitude_generated * magnitude_expected)
-        return similarity
+    def _calculate_coverage(self, generated_vectors: np.ndarray, expected_vectors: np.ndarray, threshold: float) -> float:
+        # Count, for every generated sentence, the expected sentences at or above its row quantile.
+        # Repeated expected sentences must tie exactly at the quantile, like in the pairwise metric. BLAS may round
+        # identical columns differently, so similarities are computed once per distinct vector and broadcast back.
+        unique_vectors, inverse = np.unique(expected_vectors, axis=0, return_inverse=True)
+        similarity_scores = (generated_vectors @ unique_vectors.T)[:, inverse.reshape(-1)]
+        quantiles = np.quantile(similarity_scores, threshold, axis=1, keepdims=True)
+        coverage = (similarity_scores >= quantiles).sum(axis=1) / expected_vectors.shape[0]
+        return float(np.mean(coverage))
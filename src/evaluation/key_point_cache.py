@@ -0,0 +1,58 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+
+class KeyPointCache:
+    """
+    On-disk cache of extracted key points keyed by (sha256(text), model, num_topics, max_words_per_topic, prompt_version).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS key_points (
+                                    "key" TEXT PRIMARY KEY,
+                                    "key_points" TEXT NOT NULL
+                                );""")
+        self.connection.commit()
+
+    @staticmethod
+    def get_key(text: str, model: str, num_topics: int, max_words_per_topic: int, prompt_version: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{num_topics}:{max_words_per_topic}:{prompt_version}:{text_hash}"
+
+    def get(self, key: str) -> list[str] | None:
+        with self.lock:
+            row = self.connection.execute("SELECT key_points FROM key_points WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return json.loads(row[0])
+
+    def contains(self, key: str) -> bool:
+        """
+        Whether key is cached, without counting a hit or a miss
+        """
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM key_points WHERE key = ?", (key,)).fetchone() is not None
+
+    def set(self, key: str, key_points: list[str]) -> None:
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO key_points (key, key_points) VALUES (?, ?)", (key, json.dumps(key_points)))
+            self.connection.commit()
+
+    def get_stats(self) -> dict[str, float]:
+        with self.lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "hit_rate": self.stats["hits"] / total if total else 0.0}
+
+    def close(self) -> None:
+        self.connection.close()
@@ -1,9 +1,14 @@
 import json
+import hashlib
+import threading
+import numpy as np
 
 from openai import AzureOpenAI
 
 from .base import EvaluationMetric
 from src.data.model import EvaluationData
+from src.embedding.service import EmbeddingService
+from .key_point_cache import KeyPointCache
 
 PROMPT_KEY_POINTS_EXTRACTION = f"""
 You are an AI assistant to help with extracting relevant, coherent and key topics from a given context.
@@ -12,16 +17,24 @@ You have to extract top NUM_TOPICS key topics from the given context.
 Make sure each topic does not exceed MAX_WORDS_PER_TOPIC words.
 Response format: {{"key_points": ["topic1", "topic2", "topic3"]}}
 """
+# Changes whenever the prompt text changes, so cached key points from an older prompt are never reused.
+PROMPT_KEY_POINTS_EXTRACTION_VERSION = hashlib.sha256(PROMPT_KEY_POINTS_EXTRACTION.encode("utf-8")).hexdigest()[:12]
 
 class KeyPointCoverageScore(EvaluationMetric):
     def __init__(self):
         self.num_topics = 3
         self.max_words_per_topic = 2
         self.use_cosine_similarity = False
+        self.embedding_service: EmbeddingService = None
+        # Set when prepare built the service itself, close() shuts it down.
+        self.owned_embedding_service: EmbeddingService = None
+        self.key_point_cache: KeyPointCache = None
+        self.key_point_vectors: dict[str, np.ndarray] = {}
+        self.embedding_stats = {"answers": 0, "embedding_calls": 0, "previous_embedding_calls": 0}
+        self.lock = threading.Lock()
         super().__init__("KeyPointCoverageScore")
     
     def evaluate(self, **kwargs) -> list[EvaluationData]:
-        average_score = 0.0
         answers_with_scores = []
         answers : list[EvaluationData] = kwargs.get("answers")
         openai_client = kwargs.get("openai_client")
@@ -32,34 +45,89 @@ class KeyPointCoverageScore(EvaluationMetric):
         
         if not answers or not openai_client or not embedding_client or not openai_model or not embeddings_model:
             raise ValueError("Answers, OpenAI client, embedding client, OpenAI model, and embeddings model are required.")
+        self.prepare(embedding_client=embedding_client, embedding_model=embeddings_model,
+                     embedding_cache=kwargs.get("embedding_cache"), embedding_service=kwargs.get("embedding_service"),
+                     key_point_cache=kwargs.get("key_point_cache"))
         
-        for answer in answers:
-            actual = answer.generated_answer
-            expected = answer.expected_answer
-            if actual and expected:
-                actual_key_points = self._extract_key_points(actual, openai_client, openai_model)
-                expected_key_points = self._extract_key_points(expected, openai_client, openai_model)
-                high_similarity_count = self._calculate_similarity(actual_key_points, expected_key_points,
-                                                                    embedding_client, embeddings_model, cosine_similarity_threshold)
-                if len(actual_key_points) > 0:
-                    key_point_score = high_similarity_count / len(actual_key_points)
-                else:
-                    key_point_score = 0
-            else:
-                key_point_score = 0.0
-            answer.set_kp_cov_cs_score(key_point_score)
-            answers_with_scores.append(answer)
+        try:
+            for answer in answers:
+                self.score_answer(answer, openai_client, openai_model, cosine_similarity_threshold)
+                answers_with_scores.append(answer)
+        finally:
+            self.close()
         
+        self.summarize(answers)
+        return answers_with_scores
+    
+    def prepare(self, embedding_client: AzureOpenAI, embedding_model: str, embedding_cache=None,
+                embedding_service: EmbeddingService = None, key_point_cache: KeyPointCache = None) -> None:
+        self.close()
+        if embedding_service is None:
+            embedding_service = self.owned_embedding_service = EmbeddingService(embedding_client=embedding_client, model=embedding_model,
+                                                                                embedding_cache=embedding_cache)
+        self.embedding_service = embedding_service
+        self.key_point_cache = key_point_cache
+        self.key_point_vectors = {}
+        self.embedding_stats = {"answers": 0, "embedding_calls": 0, "previous_embedding_calls": 0}
+    
+    def close(self) -> None:
+        if self.owned_embedding_service is not None:
+            self.owned_embedding_service.close()
+            self.owned_embedding_service = None
+
+    def score_answer(self, answer: EvaluationData, openai_client, openai_model: str, cosine_similarity_threshold: float) -> float:
+        actual = answer.generated_answer
+        expected = answer.expected_answer
+        if actual and expected:
+            actual_key_points = self._extract_key_points(actual, openai_client, openai_model)
+            expected_key_points = self._extract_key_points(expected, openai_client, openai_model)
+            high_similarity_count = self._calculate_similarity(actual_key_points, expected_key_points, cosine_similarity_threshold)
+            if len(actual_key_points) > 0:
+                key_point_score = high_similarity_count / len(actual_key_points)
+            else:
+                key_point_score = 0
+        else:
+            key_point_score = 0.0
+        answer.set_kp_cov_cs_score(key_point_score)
+        return key_point_score
+    
+    def summarize(self, answers: list[EvaluationData]) -> float:
+        average_score = 0.0
         if answers:
             average_score = sum([answer.kp_cov_cs_score for answer in answers]) / len(answers)
         self.set_score(average_score)
         print(f"Key Point Coverage Score: {average_score} from {len(answers)} answers.")
-        return answers_with_scores
+        if self.embedding_stats["answers"]:
+            saved = self.embedding_stats["previous_embedding_calls"] - self.embedding_stats["embedding_calls"]
+            print(f"Key point embedding calls: {self.embedding_stats['embedding_calls']} "
+                  f"(previous matcher: {self.embedding_stats['previous_embedding_calls']}, "
+                  f"saved {saved / self.embedding_stats['answers']:.2f} per answer)")
+        return average_score
+    
+    def warm_key_point_cache(self, texts: list[str], openai_client, openai_model: str, key_point_cache: KeyPointCache) -> int:
+        """
+        Extract and cache key points for texts that are not cached yet, returns the number of extraction calls made
+        """
+        self.key_point_cache = key_point_cache
+        extracted = 0
+        for text in dict.fromkeys(text for text in texts if text):
+            # contains() leaves the hit/miss statistics to the evaluation itself.
+            if not key_point_cache.contains(self._get_key_point_cache_key(text, openai_model)):
+                self._request_key_points(text, openai_client, openai_model)
+                extracted += 1
+        return extracted
+    
+    def _get_key_point_cache_key(self, text: str, model: str) -> str:
+        return KeyPointCache.get_key(text, model, self.num_topics, self.max_words_per_topic, PROMPT_KEY_POINTS_EXTRACTION_VERSION)
     
-    def _convert_string_to_vector(self, string: str, embedding_client: AzureOpenAI, model: str) -> list[float]:
-        return embedding_client.embeddings.create(input=string, model=model).data[0].embedding
-        
     def _extract_key_points(self, text: str, openai_client, model: str) -> list[str]:
+        if self.key_point_cache is not None:
+            key_points = self.key_point_cache.get(self._get_key_point_cache_key(text, model))
+            if key_points is not None:
+                return key_points
+        return self._request_key_points(text, openai_client, model)
+
+    def _request_key_points(self, text: str, openai_client, model: str) -> list[str]:
         response = openai_client.chat.completions.create(
             model=model,
             messages=[{"role": "system", "content": PROMPT_KEY_POINTS_EXTRACTION.replace("NUM_TOPICS", str(self.num_topics)).replace("MAX_WORDS_PER_TOPIC", str(self.max_words_per_topic))},
@@ -72,30 +140,38 @@ class KeyPointCoverageScore(EvaluationMetric):
             key_points = json.loads(response)["key_points"]
         except json.JSONDecodeError:
             key_points = []
+        else:
+            if self.key_point_cache is not None:
+                self.key_point_cache.set(self._get_key_point_cache_key(text, model), key_points)
         print(f"Extracted Key Points: {key_points}")
         return key_points
 
-    def _calculate_similarity(self, actual_key_points: list[str], expected_key_points: list[str],
-                              embedding_client: AzureOpenAI, model: str, threshold: float) -> int:
-        high_similarity_count = 0
-        for actual_key_point in actual_key_points:
-            actual_vector = self._convert_string_to_vector(actual_key_point, embedding_client, model)
-            for expected_key_point in expected_key_points:
-                expected_vector = self._convert_string_to_vector(expected_key_point, embedding_client, model)
-                if self.use_cosine_similarity:
-                    similarity = self._calculate_cosine_similarity(actual_vector, expected_vector)
-                    if similarity > threshold:
-                        high_similarity_count += 1
-                        break
-                else:
-                    if actual_key_point.lower() == expected_key_point.lower():
-                        high_similarity_count += 1
-                        break
-        return high_similarity_count
+    def _calculate_similarity(self, actual_key_points: list[str], expected_key_points: list[str], threshold: float) -> int:
+        with self.lock:
+            self.embedding_stats["answers"] += 1
+        if not actual_key_points or not expected_key_points:
+            return 0
+        if self.use_cosine_similarity:
+            actual_vectors = self._get_key_point_vectors(actual_key_points)
+            expected_vectors = self._get_key_point_vectors(expected_key_points)
+            matches = (actual_vectors @ expected_vectors.T) > threshold
+        else:
+            matches = np.array([[actual.lower() == expected.lower() for expected in expected_key_points] for actual in actual_key_points])
+        # The previous matcher embedded each actual key point once, plus every expected key point it compared before the first match.
+        first_match = np.where(matches.any(axis=1), matches.argmax(axis=1) + 1, len(expected_key_points))
+        with self.lock:
+            self.embedding_stats["previous_embedding_calls"] += int(len(actual_key_points) + first_match.sum())
+        return int(matches.any(axis=1).sum())
     
-    def _calculate_cosine_similarity(self, actual: list[float], expected: list[float]) -> float:
-        dot_product = sum([a * b for a, b in zip(actual, expected)])
-        magnitude_actual = sum([a ** 2 for a in actual]) ** 0.5
-        magnitude_expected = sum([b ** 2 for b in expected]) ** 0.5
-        similarity = dot_product / (magnitude_actual * magnitude_expected)
-        return similarity
+    def _get_key_point_vectors(self, key_points: list[str]) -> np.ndarray:
+        # Each unique key point is embedded once per run and kept normalized.
+        missing = [key_point for key_point in dict.fromkeys(key_points) if key_point not in self.key_point_vectors]
+        if missing:
+            vectors = np.asarray(self.embedding_service.embed_many(missing), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            with self.lock:
+                for key_point, vector in zip(missing, vectors / norms):
+                    self.key_point_vectors[key_point] = vector
+                self.embedding_stats["embedding_calls"] += len(missing)
+        return np.stack([self.key_point_vectors[key_point] for key_point in key_points])
@@ -1,5 +1,13 @@
+import json
+import time
+import asyncio
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
     SearchField,
@@ -17,14 +25,29 @@ from azure.search.documents.indexes.models import (
     SearchIndex,
 )
 from azure.search.documents.models import VectorizedQuery
-from .model import Memory, ResidualMemory, UserQuestionMemory, AssistantResponseMemory
+from .base import MemoryStore, MEMORY_TYPES, get_embedding_dimensions
+from .model import Memory
+from src.utils.retry import get_backoff_delay
+
+# Azure AI Search accepts at most 1000 documents and 16 MB per indexing request.
+MAX_BATCH_DOCUMENTS = 1000
+MAX_BATCH_BYTES = 15 * 1024 * 1024
+RETRYABLE_STATUS_CODES = {409, 422, 429, 503}
+# Maximum number of distinct users and agents returned by the statistics facets.
+FACET_LIMIT = 1000
+MEMORY_FIELDS = ["id", "user", "agent", "memory", "classification", "recall", "created_at", "last_recalled_at"]
 
 
-class AzureAISearch:
-    def __init__(self, endpoint: str, key: str, index_name: str):
+class AzureAISearch(MemoryStore):
+    def __init__(self, endpoint: str, key: str, index_name: str, max_workers: int = 8):
         self.index_name = index_name
         self.search_client = SearchClient(endpoint=endpoint, index_name=index_name, credential=AzureKeyCredential(key))
         self.index_client = SearchIndexClient(endpoint=endpoint, credential=AzureKeyCredential(key))
+        # The async client keeps its own connection pool and is shared by every coroutine using this instance.
+        self.async_search_client = AsyncSearchClient(endpoint=endpoint, index_name=index_name, credential=AzureKeyCredential(key))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.facetable = False
+        self.dimensions = None
     
     def create_index(self, model: str):
         try:
@@ -32,91 +55,264 @@ class AzureAISearch:
         except Exception as e:
             index_definition = self._create_index_definition(self.index_name, model)
             self.index_client.create_index(index_definition)
+            self._read_index_definition(index_definition)
+            return
+        self._read_index_definition(index_definition)
+        # Indexes created before recall tracking lack last_recalled_at, adding a field is a non-breaking index update.
+        if not any(field.name == "last_recalled_at" for field in index_definition.fields):
+            index_definition.fields.append(self._create_last_recalled_at_field())
+            self.index_client.create_or_update_index(index_definition)
     
-    async def upload_memories(self, memories: list[Memory]):
+    async def upload_memories(self, memories: list[Memory], max_batch_documents: int = MAX_BATCH_DOCUMENTS,
+                              max_batch_bytes: int = MAX_BATCH_BYTES, max_concurrency: int = 4, max_retries: int = 5) -> dict:
         if not memories:
             print("******** No memories to upload **********")
             return
-        self.search_client.upload_documents(documents=[mem.to_dict() for mem in memories])
+        return await self._index_documents("upload", [mem.to_dict() for mem in memories], max_batch_documents,
+                                           max_batch_bytes, max_concurrency, max_retries)
+
+    async def update_memories(self, updates: list[dict], max_concurrency: int = 4, max_retries: int = 5) -> dict:
+        if not updates:
+            return
+        return await self._index_documents("merge", updates, MAX_BATCH_DOCUMENTS, MAX_BATCH_BYTES, max_concurrency, max_retries)
+
+    async def delete_memories(self, ids: list[str], max_concurrency: int = 4, max_retries: int = 5) -> dict:
+        if not ids:
+            return
+        return await self._index_documents("delete", [{"id": id} for id in ids], MAX_BATCH_DOCUMENTS, MAX_BATCH_BYTES,
+                                           max_concurrency, max_retries)
+
+    async def _index_documents(self, action: str, documents: list[dict], max_batch_documents: int,
+                               max_batch_bytes: int, max_concurrency: int, max_retries: int) -> dict:
+        start = time.perf_counter()
+        batches = self._batch_documents(documents, max_batch_documents, max_batch_bytes)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        failed = await asyncio.gather(*[self._upload_batch(batch, semaphore, max_retries, action) for batch in batches])
+        elapsed = time.perf_counter() - start
+        report = {
+            "documents": len(documents),
+            "batches": len(batches),
+            "failed": sum(failed),
+            "seconds": elapsed,
+            "documents_per_second": len(documents) / elapsed if elapsed else 0.0,
+        }
+        print(f"Indexed ({action}) {report['documents'] - report['failed']}/{report['documents']} memories in {report['batches']} batches "
+              f"({report['documents_per_second']:.1f} documents/s)")
+        return report
     
-    def count_memories(self, type: str, user: str = None, agent: str = None, top: int = 200) -> int:
-        query_filter = f"type eq '{type}'"
-        if user:
-            query_filter += f" and user eq '{user}'"
-        if agent:
-            query_filter += f" and agent eq '{agent}'"
+    async def _upload_batch(self, documents: list[dict], semaphore: asyncio.Semaphore, max_retries: int, action: str = "upload") -> int:
+        # Throttled requests are retried as a whole, documents rejected individually are retried on their own.
+        index_action = {
+            "upload": self.async_search_client.upload_documents,
+            "merge": self.async_search_client.merge_documents,
+            "delete": self.async_search_client.delete_documents,
+        }[action]
+        pending = documents
+        failed_count = 0
+        for attempt in range(max_retries + 1):
+            try:
+                async with semaphore:
+                    results = await index_action(documents=pending)
+            except HttpResponseError as e:
+                if e.status_code not in (429, 503) or attempt == max_retries:
+                    print(f"Error indexing ({action}) {len(pending)} memories: {e}")
+                    return failed_count + len(pending)
+                await asyncio.sleep(get_backoff_delay(attempt))
+                continue
+            failed = {result.key: result for result in results if not result.succeeded}
+            retryable_keys = {key for key, result in failed.items() if result.status_code in RETRYABLE_STATUS_CODES}
+            for key, result in failed.items():
+                if key not in retryable_keys:
+                    print(f"Memory {key} was rejected: {result.status_code} {result.error_message}")
+            failed_count += len(failed) - len(retryable_keys)
+            pending = [document for document in pending if document["id"] in retryable_keys]
+            if not pending:
+                return failed_count
+            if attempt < max_retries:
+                await asyncio.sleep(get_backoff_delay(attempt))
+        return failed_count + len(pending)
+    
+    def _batch_documents(self, documents: list[dict], max_batch_documents: int, max_batch_bytes: int) -> list[list[dict]]:
+        batches = []
+        batch = []
+        batch_bytes = 0
+        for document in documents:
+            document_bytes = len(json.dumps(document))
+            if batch and (len(batch) >= max_batch_documents or batch_bytes + document_bytes > max_batch_bytes):
+                batches.append(batch)
+                batch = []
+                batch_bytes = 0
+            batch.append(document)
+            batch_bytes += document_bytes
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    async def close(self):
+        await self.async_search_client.close()
+    
+    def _read_index_definition(self, index_definition: SearchIndex) -> None:
+        fields = {field.name: field for field in index_definition.fields}
+        # Facets need facetable fields, indexes created before the statistics API fall back to one count per type.
+        self.facetable = all(fields[name].facetable for name in ("type", "user", "agent") if name in fields)
+        self.dimensions = fields["memoryVector"].vector_search_dimensions if "memoryVector" in fields else None
+
+    def count_memories(self, type: str, user: str = None, agent: str = None) -> int:
         results = self.search_client.search(
-            search_text="",
-            filter=query_filter,
-            top=top,
-            select=["created_at"],
+            search_text="*",
+            filter=self._build_filter(type, user, agent),
+            top=0,
+            include_total_count=True,
         )
-        count = 0
-        for result in results:
-            count += 1
-        return count
+        return results.get_count()
+
+    def get_memory_stats(self, user: str = None, agent: str = None) -> dict:
+        stats = {"users": None, "agents": None, "truncated": False}
+        if self.facetable:
+            results = self.search_client.search(
+                search_text="*",
+                filter=self._build_filter(None, user, agent),
+                top=0,
+                include_total_count=True,
+                facets=[f"type,count:{len(MEMORY_TYPES)}", f"user,count:{FACET_LIMIT}", f"agent,count:{FACET_LIMIT}"],
+            )
+            stats["total"] = results.get_count()
+            facets = results.get_facets() or {}
+            counts = {field: {facet["value"]: facet["count"] for facet in facets.get(field, [])} for field in ("type", "user", "agent")}
+            types = {type: counts["type"].get(type, 0) for type in MEMORY_TYPES}
+            stats["users"] = counts["user"]
+            stats["agents"] = counts["agent"]
+            # Facets return at most FACET_LIMIT values and cannot be paged, a full facet may be missing users or agents.
+            stats["truncated"] = any(len(facets.get(field, [])) >= FACET_LIMIT for field in ("user", "agent"))
+        else:
+            futures = {type: self.executor.submit(self.count_memories, type=type, user=user, agent=agent) for type in MEMORY_TYPES}
+            types = {type: future.result() for type, future in futures.items()}
+            stats["total"] = sum(types.values())
+        # Index statistics are refreshed periodically by the service and cover the whole index.
+        index_statistics = self.index_client.get_index_statistics(self.index_name)
+        vector_bytes = (self.dimensions or 0) * 4
+        return {
+            "total": stats["total"],
+            "types": types,
+            "users": stats["users"],
+            "agents": stats["agents"],
+            "truncated": stats["truncated"],
+            "vectors": dict(types),
+            "dimensions": self.dimensions,
+            "vector_bytes": {type: count * vector_bytes for type, count in types.items()},
+            "index_size_bytes": index_statistics.get("storage_size"),
+            "vector_index_size_bytes": index_statistics.get("vector_index_size"),
+        }
     
     def search_memory(self, query: str, query_vector: list[float], type: str,
                       user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> list[Memory]:
         search_vector = VectorizedQuery(vector=query_vector, k_nearest_neighbors=top, fields="memoryVector")
-        query_filter = f"type eq '{type}'"
-        if user:
-            query_filter += f" and user eq '{user}'"
-        if agent:
-            query_filter += f" and agent eq '{agent}'"
+        query_filter = self._build_filter(type, user, agent)
         results = self.search_client.search(
             search_text=query,
             vector_queries=[search_vector],
             filter=query_filter,
             top=top,
-            select=["memory", "classification", "recall", "created_at"],
+            select=MEMORY_FIELDS,
         )
         memories = []
         for result in results:
             if result["@search.score"] < relevance_threshold:
                 continue
-            if type == "residual":
-                memory = ResidualMemory(
-                    memory=result["memory"],
-                    classification=result["classification"],
-                    recall=result["recall"],
-                    created_at=result["created_at"],
-                    search_score=result["@search.score"],
-                )
-            elif type == "user_question":
-                memory = UserQuestionMemory(
-                    memory=result["memory"],
-                    classification=result["classification"],
-                    recall=result["recall"],
-                    created_at=result["created_at"],
-                    search_score=result["@search.score"],
-                )
-            elif type == "assistant_response":
-                memory = AssistantResponseMemory(
-                    memory=result["memory"],
-                    classification=result["classification"],
-                    recall=result["recall"],
-                    created_at=result["created_at"],
-                    search_score=result["@search.score"],
-                )
-            else:
-                raise ValueError(f"Invalid memory type: {type}")
-            memories.append(memory)
+            memories.append(self._to_memory(type, result))
         return memories
 
+    def search_similar_memories(self, query_vector: list[float], type: str, user: str = None, agent: str = None,
+                                top: int = 1, similarity_threshold: float = 0.95) -> list[Memory]:
+        search_vector = VectorizedQuery(vector=query_vector, k_nearest_neighbors=top, fields="memoryVector")
+        results = self.search_client.search(
+            search_text=None,
+            vector_queries=[search_vector],
+            filter=self._build_filter(type, user, agent),
+            top=top,
+            select=MEMORY_FIELDS,
+        )
+        memories = []
+        for result in results:
+            # A vector-only cosine query scores 1 / (1 + (1 - cosine)), turn it back into the cosine similarity.
+            similarity = 2 - 1 / result["@search.score"]
+            if similarity < similarity_threshold:
+                continue
+            memories.append(self._to_memory(type, {**result, "@search.score": similarity}))
+        return memories
+
+    def iter_memories(self, type: str, user: str = None, agent: str = None) -> Iterator[Memory]:
+        # Result paging relies on $skip, which Azure AI Search caps at 100,000 documents per filter.
+        results = self.search_client.search(
+            search_text="*",
+            filter=self._build_filter(type, user, agent),
+            select=MEMORY_FIELDS + ["memoryVector"],
+        )
+        for result in results:
+            yield self._to_memory(type, result)
+
+    def search_memories(self, query: str, query_vector: list[float], types: list[str] = MEMORY_TYPES,
+                        user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]]:
+        # A type filter applies to the whole request, so per-type top-k needs one search per type.
+        # They are issued concurrently so the latency is about a single round-trip.
+        futures = {
+            type: self.executor.submit(self.search_memory, query=query, query_vector=query_vector, type=type,
+                                       user=user, agent=agent, top=top, relevance_threshold=relevance_threshold)
+            for type in types
+        }
+        return {type: future.result() for type, future in futures.items()}
+
+    async def asearch_memory(self, query: str, query_vector: list[float], type: str,
+                             user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> list[Memory]:
+        search_vector = VectorizedQuery(vector=query_vector, k_nearest_neighbors=top, fields="memoryVector")
+        results = await self.async_search_client.search(
+            search_text=query,
+            vector_queries=[search_vector],
+            filter=self._build_filter(type, user, agent),
+            top=top,
+            select=MEMORY_FIELDS,
+        )
+        memories = []
+        async for result in results:
+            if result["@search.score"] < relevance_threshold:
+                continue
+            memories.append(self._to_memory(type, result))
+        return memories
+
+    async def asearch_memories(self, query: str, query_vector: list[float], types: list[str] = MEMORY_TYPES,
+                               user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]]:
+        results = await asyncio.gather(*[
+            self.asearch_memory(query=query, query_vector=query_vector, type=type,
+                                user=user, agent=agent, top=top, relevance_threshold=relevance_threshold)
+            for type in types
+        ])
+        return dict(zip(types, results))
+
+    def _build_filter(self, type: str = None, user: str = None, agent: str = None) -> str | None:
+        clauses = []
+        if type:
+            clauses.append(f"type eq '{type}'")
+        if user:
+            clauses.append(f"user eq '{user}'")
+        if agent:
+            clauses.append(f"agent eq '{agent}'")
+        return " and ".join(clauses) or None
+
+    def _create_last_recalled_at_field(self) -> SimpleField:
+        return SimpleField(name="last_recalled_at", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True)
+
     def _create_index_definition(self, index_name: str, model: str) -> SearchIndex:
-        dimensions = 1536
-        if model == "text-embedding-3-large":
-            dimensions = 3072
+        dimensions = get_embedding_dimensions(model)
 
         fields = [
             SimpleField(name="id", type=SearchFieldDataType.String, key=True),
-            SimpleField(name="type", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="user", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="agent", type=SearchFieldDataType.String, filterable=True),
+            SimpleField(name="type", type=SearchFieldDataType.String, filterable=True, facetable=True),
+            SimpleField(name="user", type=SearchFieldDataType.String, filterable=True, facetable=True),
+            SimpleField(name="agent", type=SearchFieldDataType.String, filterable=True, facetable=True),
             SimpleField(name="recall", type=SearchFieldDataType.Int32, filterable=True),
             SimpleField(name="classification", type=SearchFieldDataType.String, filterable=True),
             SimpleField(name="created_at", type=SearchFieldDataType.DateTimeOffset, filterable=True),
+            self._create_last_recalled_at_field(),
             SearchableField(name="memory", type=SearchFieldDataType.String),
             SearchField(
                 name="memoryVector",
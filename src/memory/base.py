@@ -0,0 +1,104 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Iterator
+
+from .model import Memory, ResidualMemory, UserQuestionMemory, AssistantResponseMemory
+
+MEMORY_TYPES = ["residual", "user_question", "assistant_response"]
+
+
+def get_embedding_dimensions(model: str) -> int:
+    if model == "text-embedding-3-large":
+        return 3072
+    return 1536
+
+
+class MemoryStore(ABC):
+    @abstractmethod
+    def create_index(self, model: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def upload_memories(self, memories: list[Memory]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_memory(self, query: str, query_vector: list[float], type: str,
+                      user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> list[Memory]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_memories(self, type: str, user: str = None, agent: str = None) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_memory_stats(self, user: str = None, agent: str = None) -> dict:
+        """
+        Exact memory counts by type, user and agent, per-type vector counts and approximate index size, without listing memories.
+        truncated is True when the store could only return part of the per-user or per-agent counts.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_similar_memories(self, query_vector: list[float], type: str, user: str = None, agent: str = None,
+                                top: int = 1, similarity_threshold: float = 0.95) -> list[Memory]:
+        """
+        Vector-only search returning memories whose cosine similarity (stored as search_score) is at least the threshold
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_memories(self, updates: list[dict]):
+        """
+        Merge partial documents (each holding an id) into existing memories
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_memories(self, ids: list[str]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_memories(self, type: str, user: str = None, agent: str = None) -> Iterator[Memory]:
+        """
+        Iterate over every stored memory of a type, including its vector
+        """
+        raise NotImplementedError
+
+    def search_memories(self, query: str, query_vector: list[float], types: list[str] = MEMORY_TYPES,
+                        user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]]:
+        return {
+            type: self.search_memory(query=query, query_vector=query_vector, type=type, user=user, agent=agent,
+                                     top=top, relevance_threshold=relevance_threshold)
+            for type in types
+        }
+
+    async def asearch_memories(self, query: str, query_vector: list[float], types: list[str] = MEMORY_TYPES,
+                               user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]]:
+        return await asyncio.to_thread(self.search_memories, query=query, query_vector=query_vector, types=types,
+                                       user=user, agent=agent, top=top, relevance_threshold=relevance_threshold)
+
+    async def close(self):
+        pass
+
+    def _to_memory(self, type: str, result: dict) -> Memory:
+        if type == "residual":
+            memory_class = ResidualMemory
+        elif type == "user_question":
+            memory_class = UserQuestionMemory
+        elif type == "assistant_response":
+            memory_class = AssistantResponseMemory
+        else:
+            raise ValueError(f"Invalid memory type: {type}")
+        return memory_class(
+            id=result.get("id"),
+            memory=result["memory"],
+            user=result.get("user") or "",
+            agent=result.get("agent") or "",
+            memoryVector=result.get("memoryVector") or [],
+            classification=result["classification"],
+            recall=result["recall"],
+            created_at=result["created_at"],
+            last_recalled_at=result.get("last_recalled_at"),
+            search_score=result.get("@search.score", 0.0),
+        )
@@ -0,0 +1,68 @@
+import re
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Incremental inverted index with Okapi BM25 scoring, using the k1/b defaults of Azure AI Search.
+    Documents are identified by their integer row in the owning store.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self.doc_terms: dict[int, Counter] = {}
+        self.doc_lengths: dict[int, int] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: int, text: str) -> None:
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self.postings[term][doc_id] = frequency
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+
+    def remove(self, doc_id: int) -> None:
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def score(self, query: str, size: int) -> np.ndarray:
+        """
+        Return BM25 scores for rows [0, size), rows without a matching term score 0
+        """
+        scores = np.zeros(size, dtype=np.float32)
+        if not self.doc_lengths:
+            return scores
+        num_docs = len(self.doc_lengths)
+        average_length = self.total_length / num_docs
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            frequencies = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            lengths = np.fromiter((self.doc_lengths[row] for row in postings), dtype=np.float32, count=len(postings))
+            keep = rows < size
+            rows, frequencies, lengths = rows[keep], frequencies[keep], lengths[keep]
+            norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+        return scores
@@ -0,0 +1,188 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Iterator
+
+from .base import MemoryStore, MEMORY_TYPES
+from .model import Memory
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Document fields whose change can alter search results, updates touching only recall bookkeeping keep the cache.
+SEARCH_FIELDS = {"type", "user", "agent", "memory", "memoryVector"}
+
+
+def normalize_query(query: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", query or "").strip().lower()
+
+
+class CachedMemoryStore(MemoryStore):
+    """
+    Retrieval cache in front of a memory store. Results are cached per memory type with LRU and TTL eviction,
+    keyed by (normalized query, type, top, threshold, user, agent). Every type has a generation counter that is
+    bumped whenever memories of that type are written, entries from an older generation are treated as misses.
+    """
+    def __init__(self, memory_store: MemoryStore, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.memory_store = memory_store
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[tuple, tuple[float, int, list[Memory]]] = OrderedDict()
+        self.generations = {type: 0 for type in MEMORY_TYPES}
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "invalidated": 0}
+
+    def get_cached_memories(self, query: str, types: list[str] = MEMORY_TYPES, user: str = None, agent: str = None,
+                            top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]] | None:
+        """
+        Return cached results for every type, or None when any type misses, so callers can skip embedding the query
+        """
+        memories = {}
+        for type in types:
+            # Peeking keeps the statistics exact, a miss is counted by the search that follows.
+            cached = self._get(self._get_key(query, type, top, relevance_threshold, user, agent), type, record=False)
+            if cached is None:
+                return None
+            memories[type] = cached
+        with self.lock:
+            self.stats["hits"] += len(types)
+        return memories
+
+    def search_memory(self, query: str, query_vector: list[float], type: str,
+                      user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> list[Memory]:
+        key = self._get_key(query, type, top, relevance_threshold, user, agent)
+        cached = self._get(key, type)
+        if cached is not None:
+            return cached
+        with self.lock:
+            generation = self.generations.get(type, 0)
+        memories = self.memory_store.search_memory(query=query, query_vector=query_vector, type=type, user=user, agent=agent,
+                                                   top=top, relevance_threshold=relevance_threshold)
+        self._set(key, generation, memories)
+        return list(memories)
+
+    def search_memories(self, query: str, query_vector: list[float], types: list[str] = MEMORY_TYPES,
+                        user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]]:
+        memories, missing, generations = self._get_many(query, types, top, relevance_threshold, user, agent)
+        if missing:
+            results = self.memory_store.search_memories(query=query, query_vector=query_vector, types=missing, user=user,
+                                                        agent=agent, top=top, relevance_threshold=relevance_threshold)
+            self._set_many(query, results, generations, top, relevance_threshold, user, agent)
+            memories.update(results)
+        return {type: list(memories[type]) for type in types}
+
+    async def asearch_memories(self, query: str, query_vector: list[float], types: list[str] = MEMORY_TYPES,
+                               user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]]:
+        memories, missing, generations = self._get_many(query, types, top, relevance_threshold, user, agent)
+        if missing:
+            results = await self.memory_store.asearch_memories(query=query, query_vector=query_vector, types=missing, user=user,
+                                                               agent=agent, top=top, relevance_threshold=relevance_threshold)
+            self._set_many(query, results, generations, top, relevance_threshold, user, agent)
+            memories.update(results)
+        return {type: list(memories[type]) for type in types}
+
+    def create_index(self, model: str):
+        return self.memory_store.create_index(model=model)
+
+    async def upload_memories(self, memories: list[Memory]):
+        result = await self.memory_store.upload_memories(memories=memories)
+        self.invalidate({memory.type for memory in memories})
+        return result
+
+    async def update_memories(self, updates: list[dict]):
+        result = await self.memory_store.update_memories(updates)
+        if any(update.keys() & SEARCH_FIELDS for update in updates):
+            self.invalidate()
+        return result
+
+    async def delete_memories(self, ids: list[str]):
+        result = await self.memory_store.delete_memories(ids)
+        if ids:
+            self.invalidate()
+        return result
+
+    def search_similar_memories(self, query_vector: list[float], type: str, user: str = None, agent: str = None,
+                                top: int = 1, similarity_threshold: float = 0.95) -> list[Memory]:
+        return self.memory_store.search_similar_memories(query_vector=query_vector, type=type, user=user, agent=agent,
+                                                         top=top, similarity_threshold=similarity_threshold)
+
+    def iter_memories(self, type: str, user: str = None, agent: str = None) -> Iterator[Memory]:
+        return self.memory_store.iter_memories(type=type, user=user, agent=agent)
+
+    def count_memories(self, type: str, user: str = None, agent: str = None) -> int:
+        return self.memory_store.count_memories(type=type, user=user, agent=agent)
+
+    def get_memory_stats(self, user: str = None, agent: str = None) -> dict:
+        return self.memory_store.get_memory_stats(user=user, agent=agent)
+
+    async def close(self):
+        await self.memory_store.close()
+
+    def invalidate(self, types: set[str] = None) -> None:
+        """
+        Bump the generation of the given types (all types by default), their cached entries become misses
+        """
+        with self.lock:
+            for type in types if types is not None else list(self.generations):
+                self.generations[type] = self.generations.get(type, 0) + 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "generations": dict(self.generations),
+            }
+
+    def _get_key(self, query: str, type: str, top: int, relevance_threshold: float, user: str, agent: str) -> tuple:
+        return (normalize_query(query), type, top, relevance_threshold, user, agent)
+
+    def _get(self, key: tuple, type: str, record: bool = True) -> list[Memory] | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            reason = None
+            if entry is None:
+                reason = "missing"
+            elif entry[1] != self.generations.get(type, 0):
+                reason = "invalidated"
+            elif time.monotonic() - entry[0] > self.ttl_seconds:
+                reason = "expired"
+            if reason is None:
+                self.entries.move_to_end(key)
+                if record:
+                    self.stats["hits"] += 1
+                return list(entry[2])
+            if reason != "missing":
+                del self.entries[key]
+                self.stats[reason] += 1
+            if record:
+                self.stats["misses"] += 1
+            return None
+
+    def _get_many(self, query: str, types: list[str], top: int, relevance_threshold: float,
+                  user: str, agent: str) -> tuple[dict[str, list[Memory]], list[str], dict[str, int]]:
+        memories = {}
+        missing = []
+        for type in types:
+            cached = self._get(self._get_key(query, type, top, relevance_threshold, user, agent), type)
+            if cached is None:
+                missing.append(type)
+            else:
+                memories[type] = cached
+        # Generations are read before searching, so a write racing with the search leaves the result stale, not cached.
+        with self.lock:
+            generations = {type: self.generations.get(type, 0) for type in missing}
+        return memories, missing, generations
+
+    def _set(self, key: tuple, generation: int, memories: list[Memory]) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic(), generation, list(memories))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _set_many(self, query: str, results: dict[str, list[Memory]], generations: dict[str, int], top: int,
+                  relevance_threshold: float, user: str, agent: str) -> None:
+        for type, memories in results.items():
+            self._set(self._get_key(query, type, top, relevance_threshold, user, agent), generations[type], memories)
@@ -0,0 +1,24 @@
+import os
+
+from .base import MemoryStore
+
+
+def create_memory_store(store_type: str = None) -> MemoryStore:
+    """
+    Create the memory store selected by MEMORY_STORE_TYPE ("azure" by default, or "local")
+    """
+    store_type = store_type or os.environ.get("MEMORY_STORE_TYPE", "azure")
+    if store_type == "azure":
+        from .azure_ai_search import AzureAISearch
+        return AzureAISearch(
+            endpoint=os.environ['AZURE_SEARCH_ENDPOINT'],
+            key=os.environ['AZURE_SEARCH_API_KEY'],
+            index_name=os.environ['AZURE_SEARCH_INDEX_NAME']
+        )
+    elif store_type == "local":
+        from .local_store import LocalMemoryStore
+        path = os.environ.get("LOCAL_MEMORY_STORE_PATH")
+        if not path:
+            print("******** LOCAL_MEMORY_STORE_PATH is not set, the local memory store is in-memory only and nothing is persisted **********")
+        return LocalMemoryStore(path=path)
+    raise ValueError(f"Invalid memory store type: {store_type}")
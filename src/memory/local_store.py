@@ -0,0 +1,328 @@
+import os
+import json
+import asyncio
+import threading
+import numpy as np
+from typing import Iterator
+
+from .base import MemoryStore, MEMORY_TYPES, get_embedding_dimensions
+from .bm25 import BM25Index
+from .model import Memory
+
+# Reciprocal-rank fusion constant used by Azure AI Search hybrid queries. Keeping it makes fused scores land in the
+# same range as @search.score (at most 1/61 per ranking), so existing relevance thresholds keep their meaning.
+RRF_K = 60
+SNAPSHOT_FILE_NAME = "memories.npz"
+LEGACY_FILE_NAMES = ["vectors.npy", "memories.jsonl"]
+
+
+class LocalMemoryStore(MemoryStore):
+    """
+    In-process memory store. Normalized memory vectors live in one contiguous float32 matrix,
+    type, user and agent are kept as integer code arrays so filters are a single vectorized mask.
+    With hybrid enabled, a BM25 ranking over the memory text is fused with the vector ranking by reciprocal rank.
+    """
+    def __init__(self, path: str = None, dimensions: int = None, initial_capacity: int = 1024,
+                 hybrid: bool = True, text_candidates: int = 50):
+        self.path = path
+        self.hybrid = hybrid
+        self.text_candidates = text_candidates
+        self.text_index = BM25Index()
+        self.dimensions = dimensions
+        self.capacity = initial_capacity
+        self.count = 0
+        self.lock = threading.RLock()
+        # Every save request bumps write_version after its write, a snapshot taken at a later version already covers it.
+        self.save_lock = threading.Lock()
+        self.write_version = 0
+        self.saved_version = 0
+        self.documents: list[dict] = []
+        self.id_to_row: dict[str, int] = {}
+        self.codes: dict[str, dict[str, int]] = {"type": {}, "user": {}, "agent": {}}
+        self.vectors = None
+        self.type_codes = np.zeros(initial_capacity, dtype=np.int32)
+        self.user_codes = np.zeros(initial_capacity, dtype=np.int32)
+        self.agent_codes = np.zeros(initial_capacity, dtype=np.int32)
+
+    def create_index(self, model: str):
+        if self.vectors is not None:
+            return
+        if self.path and self._has_snapshot():
+            self._load()
+        if self.vectors is None:
+            self.dimensions = self.dimensions or get_embedding_dimensions(model)
+            self.vectors = np.zeros((self.capacity, self.dimensions), dtype=np.float32)
+
+    async def upload_memories(self, memories: list[Memory]):
+        if not memories:
+            print("******** No memories to upload **********")
+            return
+        self.add_documents([memory.to_dict() for memory in memories])
+        await self._persist()
+
+    def add_documents(self, documents: list[dict]) -> None:
+        with self.lock:
+            if self.vectors is None:
+                self.dimensions = self.dimensions or len(documents[0]["memoryVector"])
+                self.vectors = np.zeros((self.capacity, self.dimensions), dtype=np.float32)
+            for document in documents:
+                # Uploading an existing id replaces the document, like upload_documents on Azure AI Search.
+                row = self.id_to_row.get(document["id"])
+                if row is None:
+                    row = self.count
+                    self._ensure_capacity(row + 1)
+                    self.id_to_row[document["id"]] = row
+                    self.documents.append(None)
+                    self.count += 1
+                self._write_row(row, document)
+
+    def count_memories(self, type: str, user: str = None, agent: str = None) -> int:
+        with self.lock:
+            return int(self._build_mask(type, user, agent).sum())
+
+    def get_memory_stats(self, user: str = None, agent: str = None) -> dict:
+        with self.lock:
+            mask = np.ones(self.count, dtype=bool)
+            if user:
+                mask &= self.user_codes[:self.count] == self._get_code("user", user, create=False)
+            if agent:
+                mask &= self.agent_codes[:self.count] == self._get_code("agent", agent, create=False)
+            counts = {field: self._count_codes(field, codes[:self.count][mask])
+                      for field, codes in (("type", self.type_codes), ("user", self.user_codes), ("agent", self.agent_codes))}
+            types = {type: counts["type"].get(type, 0) for type in MEMORY_TYPES}
+            vector_bytes = (self.dimensions or 0) * np.dtype(np.float32).itemsize
+            return {
+                "total": int(mask.sum()),
+                "types": types,
+                "users": counts["user"],
+                "agents": counts["agent"],
+                "truncated": False,
+                "vectors": dict(types),
+                "dimensions": self.dimensions,
+                "vector_bytes": {type: count * vector_bytes for type, count in types.items()},
+                "index_size_bytes": sum(int(array.nbytes) for array in (self.vectors, self.type_codes, self.user_codes, self.agent_codes)
+                                        if array is not None),
+                "vector_index_size_bytes": int(self.vectors.nbytes) if self.vectors is not None else 0,
+            }
+
+    def search_memory(self, query: str, query_vector: list[float], type: str,
+                      user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> list[Memory]:
+        with self.lock:
+            if self.count == 0:
+                return []
+            mask = self._build_mask(type, user, agent)
+            candidates = int(mask.sum())
+            scores = self._vector_scores(query_vector)
+            scores[~mask] = -np.inf
+            if self.hybrid:
+                scores = self._fuse_rankings(query, scores, mask, top, candidates)
+            rows = self._top_rows(scores, min(top, candidates))
+            return [self._row_to_memory(type, row, float(scores[row])) for row in rows if scores[row] >= relevance_threshold]
+
+    def search_similar_memories(self, query_vector: list[float], type: str, user: str = None, agent: str = None,
+                                top: int = 1, similarity_threshold: float = 0.95) -> list[Memory]:
+        with self.lock:
+            if self.count == 0:
+                return []
+            mask = self._build_mask(type, user, agent)
+            scores = self._vector_scores(query_vector)
+            scores[~mask] = -np.inf
+            rows = self._top_rows(scores, min(top, int(mask.sum())))
+            return [self._row_to_memory(type, row, float(scores[row])) for row in rows if scores[row] >= similarity_threshold]
+
+    async def update_memories(self, updates: list[dict]):
+        if not updates:
+            return
+        with self.lock:
+            for update in updates:
+                row = self.id_to_row.get(update["id"])
+                if row is None:
+                    print(f"Memory {update['id']} was not found")
+                    continue
+                if "memoryVector" in update or update.keys() & {"type", "user", "agent", "memory"}:
+                    vector = update.get("memoryVector", self.vectors[row])
+                    self._write_row(row, {**self.documents[row], **update, "memoryVector": vector})
+                else:
+                    self.documents[row].update(update)
+        await self._persist()
+
+    async def delete_memories(self, ids: list[str]):
+        if not ids:
+            return
+        with self.lock:
+            for id in ids:
+                row = self.id_to_row.pop(id, None)
+                if row is not None:
+                    self._remove_row(row)
+        await self._persist()
+
+    def iter_memories(self, type: str, user: str = None, agent: str = None) -> Iterator[Memory]:
+        with self.lock:
+            rows = np.flatnonzero(self._build_mask(type, user, agent))
+            memories = [
+                self._to_memory(type, {**self.documents[row], "memoryVector": self.vectors[row].tolist()})
+                for row in rows
+            ]
+        yield from memories
+
+    async def asearch_memories(self, query: str, query_vector: list[float], types: list[str] = MEMORY_TYPES,
+                               user: str = None, agent: str = None, top: int = 3, relevance_threshold: int = 0.7) -> dict[str, list[Memory]]:
+        # Local searches never wait on I/O, a worker thread would only add overhead.
+        return self.search_memories(query=query, query_vector=query_vector, types=types, user=user, agent=agent,
+                                    top=top, relevance_threshold=relevance_threshold)
+
+    def save(self) -> None:
+        """
+        Write a snapshot of the store. Vectors and documents share one file, written to a temporary file and renamed
+        into place, so a crash leaves either the previous snapshot or the new one.
+        Returns without writing when a save that finished while this one waited already covered every write.
+        """
+        with self.lock:
+            self.write_version += 1
+            requested = self.write_version
+        with self.save_lock:
+            if self.saved_version >= requested:
+                return
+            with self.lock:
+                version = self.write_version
+                vectors = self.vectors[:self.count].copy() if self.vectors is not None else np.zeros((0, self.dimensions or 0), dtype=np.float32)
+                lines = "".join(json.dumps(document) + "\n" for document in self.documents)
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            documents = np.frombuffer(lines.encode("utf-8"), dtype=np.uint8)
+            self._write_file(os.path.join(self.path, SNAPSHOT_FILE_NAME), lambda f: np.savez(f, vectors=vectors, documents=documents))
+            # Stores saved before snapshots were a single file are migrated by their first save.
+            for file_name in LEGACY_FILE_NAMES:
+                if os.path.exists(os.path.join(self.path, file_name)):
+                    os.remove(os.path.join(self.path, file_name))
+            self.saved_version = version
+
+    async def _persist(self) -> None:
+        if self.path:
+            await asyncio.to_thread(self.save)
+
+    def _write_file(self, file_path: str, write) -> None:
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+
+    def _has_snapshot(self) -> bool:
+        return os.path.exists(os.path.join(self.path, SNAPSHOT_FILE_NAME)) or \
+            all(os.path.exists(os.path.join(self.path, file_name)) for file_name in LEGACY_FILE_NAMES)
+
+    def _load(self) -> None:
+        snapshot_path = os.path.join(self.path, SNAPSHOT_FILE_NAME)
+        if os.path.exists(snapshot_path):
+            with np.load(snapshot_path) as snapshot:
+                vectors = snapshot["vectors"]
+                lines = snapshot["documents"].tobytes().decode("utf-8").splitlines()
+        else:
+            vectors = np.load(os.path.join(self.path, "vectors.npy"))
+            with open(os.path.join(self.path, "memories.jsonl"), "r") as f:
+                lines = f.read().splitlines()
+        documents = [json.loads(line) for line in lines if line]
+        if len(documents) != len(vectors):
+            raise ValueError(f"Local memory store at {self.path} is inconsistent: {len(vectors)} vectors for {len(documents)} memories.")
+        if not documents:
+            return
+        for document, vector in zip(documents, vectors):
+            document["memoryVector"] = vector
+        self.add_documents(documents)
+
+    def _ensure_capacity(self, size: int) -> None:
+        if size <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        vectors[:self.count] = self.vectors[:self.count]
+        self.vectors = vectors
+        for name in ("type_codes", "user_codes", "agent_codes"):
+            codes = np.zeros(capacity, dtype=np.int32)
+            codes[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, codes)
+        self.capacity = capacity
+
+    def _remove_row(self, row: int) -> None:
+        # The last row is moved into the freed slot so rows stay contiguous.
+        last = self.count - 1
+        self.text_index.remove(row)
+        if row != last:
+            self.text_index.remove(last)
+            self.vectors[row] = self.vectors[last]
+            for name in ("type_codes", "user_codes", "agent_codes"):
+                getattr(self, name)[row] = getattr(self, name)[last]
+            self.documents[row] = self.documents[last]
+            self.id_to_row[self.documents[row]["id"]] = row
+            self.text_index.add(row, self.documents[row]["memory"])
+        self.documents.pop()
+        self.count -= 1
+
+    def _write_row(self, row: int, document: dict) -> None:
+        vector = np.asarray(document["memoryVector"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        self.vectors[row] = vector / norm if norm else vector
+        self.type_codes[row] = self._get_code("type", document["type"])
+        self.user_codes[row] = self._get_code("user", document["user"])
+        self.agent_codes[row] = self._get_code("agent", document["agent"])
+        self.documents[row] = {key: value for key, value in document.items() if key != "memoryVector"}
+        self.text_index.add(row, document["memory"])
+
+    def _get_code(self, field: str, value: str, create: bool = True) -> int:
+        codes = self.codes[field]
+        if value not in codes:
+            if not create:
+                return -1
+            codes[value] = len(codes)
+        return codes[value]
+
+    def _count_codes(self, field: str, codes: np.ndarray) -> dict[str, int]:
+        values = {code: value for value, code in self.codes[field].items()}
+        frequencies = np.bincount(codes, minlength=len(values))
+        return {values[code]: int(count) for code, count in enumerate(frequencies) if count}
+
+    def _build_mask(self, type: str, user: str = None, agent: str = None) -> np.ndarray:
+        mask = self.type_codes[:self.count] == self._get_code("type", type, create=False)
+        if user:
+            mask &= self.user_codes[:self.count] == self._get_code("user", user, create=False)
+        if agent:
+            mask &= self.agent_codes[:self.count] == self._get_code("agent", agent, create=False)
+        return mask
+
+    def _vector_scores(self, query_vector: list[float]) -> np.ndarray:
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        return self.vectors[:self.count] @ query
+
+    def _fuse_rankings(self, query: str, vector_scores: np.ndarray, mask: np.ndarray, top: int, candidates: int) -> np.ndarray:
+        # The vector query contributes its k nearest neighbours (k = top) and the text query its best BM25 matches,
+        # mirroring the k_nearest_neighbors=top VectorizedQuery sent to Azure AI Search.
+        fused = np.zeros(self.count, dtype=np.float32)
+        for rank, row in enumerate(self._top_rows(vector_scores, min(top, candidates)), start=1):
+            fused[row] += 1.0 / (RRF_K + rank)
+        if query:
+            text_scores = self.text_index.score(query, self.count)
+            text_scores[~mask] = 0.0
+            matches = int((text_scores > 0).sum())
+            for rank, row in enumerate(self._top_rows(text_scores, min(self.text_candidates, matches)), start=1):
+                fused[row] += 1.0 / (RRF_K + rank)
+        fused[~mask] = -np.inf
+        return fused
+
+    def _top_rows(self, scores: np.ndarray, top: int) -> np.ndarray:
+        if top <= 0:
+            return np.array([], dtype=np.int64)
+        if top < len(scores):
+            rows = np.argpartition(-scores, top - 1)[:top]
+        else:
+            rows = np.arange(len(scores))
+        return rows[np.argsort(-scores[rows])]
+
+    def _row_to_memory(self, type: str, row: int, score: float) -> Memory:
+        return self._to_memory(type, {**self.documents[row], "@search.score": score})
@@ -14,14 +14,19 @@ class Memory(BaseModel):
     memory: str
     memoryVector: List[float]
     search_score: float = 0.0
+    last_recalled_at: str | None = None
     
     def __init__(self, type: str, memory: str, user: str = "", memoryVector: List[float] = [],
-                 classification: str = "", agent: str = "", recall: int = 0, created_at: str = None, search_score: float = 0.0):
+                 classification: str = "", agent: str = "", recall: int = 0, created_at: str = None, search_score: float = 0.0,
+                 id: str = None, last_recalled_at: str = None):
         if created_at is None:
             created_at = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-        super().__init__(id=str(uuid4()), type=type, user=user,
+        if id is None:
+            id = str(uuid4())
+        super().__init__(id=id, type=type, user=user,
                          classification=classification, memory=memory, memoryVector=memoryVector,
-                         agent=agent, recall=recall, created_at=created_at, search_score=search_score)
+                         agent=agent, recall=recall, created_at=created_at, search_score=search_score,
+                         last_recalled_at=last_recalled_at)
     
     def set_classification(self, classification: str):
         self.classification = classification
@@ -41,6 +46,9 @@ class Memory(BaseModel):
     def set_search_score(self, search_score: float):
         self.search_score = search_score
     
+    def set_last_recalled_at(self, last_recalled_at: str):
+        self.last_recalled_at = last_recalled_at
+    
     def set_memory_vector(self, memoryVector: List[float]):
         self.memoryVector = memoryVector
     
@@ -53,6 +61,7 @@ class Memory(BaseModel):
             "recall": self.recall,
             "classification": self.classification,
             "created_at": self.created_at,
+            "last_recalled_at": self.last_recalled_at,
             "memory": self.memory,
             "memoryVector": self.memoryVector
         }
@@ -61,25 +70,25 @@ class ResidualMemory(Memory):
     type: str = "residual"
     def __init__(self, memory: str, user: str = "", memoryVector: List[float] = [],
                  classification: str = "", agent: str = "", recall: int = 0,
-                 created_at: str = None, search_score: float = 0.0):
+                 created_at: str = None, search_score: float = 0.0, id: str = None, last_recalled_at: str = None):
         super().__init__(type="residual", memory=memory, user=user, memoryVector=memoryVector,
                          classification=classification, agent=agent, recall=recall,
-                         created_at=created_at, search_score=search_score)
+                         created_at=created_at, search_score=search_score, id=id, last_recalled_at=last_recalled_at)
 
 class UserQuestionMemory(Memory):
     type: str = "user_question"
     def __init__(self, memory: str, user: str = "", memoryVector: List[float] = [],
                  classification: str = "", agent: str = "", recall: int = 0,
-                 created_at: str = None, search_score: float = 0.0):
+                 created_at: str = None, search_score: float = 0.0, id: str = None, last_recalled_at: str = None):
         super().__init__(type="user_question", memory=memory, user=user, memoryVector=memoryVector,
                          classification=classification, agent=agent, recall=recall,
-                         created_at=created_at, search_score=search_score)
+                         created_at=created_at, search_score=search_score, id=id, last_recalled_at=last_recalled_at)
 
 class AssistantResponseMemory(Memory):
     type: str = "assistant_response"
     def __init__(self, memory: str, user: str = "", memoryVector: List[float] = [],
                  classification: str = "", agent: str = "", recall: int = 0,
-                 created_at: str = None, search_score: float = 0.0):
+                 created_at: str = None, search_score: float = 0.0, id: str = None, last_recalled_at: str = None):
         super().__init__(type="assistant_response", memory=memory, user=user, memoryVector=memoryVector,
                          classification=classification, agent=agent, recall=recall,
-                         created_at=created_at, search_score=search_score)
+                         created_at=created_at, search_score=search_score, id=id, last_recalled_at=last_recalled_at)
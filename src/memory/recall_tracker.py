@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .base import MemoryStore
+from .model import Memory
+
+
+class RecallTracker:
+    """
+    Buffers recall increments and last_recalled_at timestamps of retrieved memories and writes them back
+    to the memory store in batched merge operations, every flush_interval seconds or once max_pending memories are dirty.
+    """
+    def __init__(self, search_client: MemoryStore, flush_interval: float = 30.0, max_pending: int = 500,
+                 max_known_recalls: int = 100000):
+        self.search_client = search_client
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        # id -> [recall known from the store, pending increments, last recall timestamp]
+        self.pending: dict[str, list] = {}
+        # Recall values already written back. Search results can lag behind a merge, so the larger value wins.
+        self.known_recalls: OrderedDict[str, int] = OrderedDict()
+        self.max_known_recalls = max_known_recalls
+        self.loop = None
+        self.flush_event = None
+        self.task = None
+        self.stats = {"recalls": 0, "flushes": 0, "updates": 0}
+
+    def record(self, memories: list[Memory] | dict[str, list[Memory]]) -> None:
+        """
+        Record that memories were returned by a search, safe to call from any thread
+        """
+        if isinstance(memories, dict):
+            memories = [memory for memory_list in memories.values() for memory in memory_list]
+        recalled_at = datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        with self.lock:
+            for memory in memories:
+                entry = self._get_entry(memory)
+                entry[1] += 1
+                entry[2] = recalled_at
+                # Searches return the recall stored at query time, the updated value is handed back to callers.
+                memory.recall = entry[0] + entry[1]
+                memory.last_recalled_at = recalled_at
+            self.stats["recalls"] += len(memories)
+            should_flush = len(self.pending) >= self.max_pending
+        if should_flush and self.flush_event is not None:
+            self.loop.call_soon_threadsafe(self.flush_event.set)
+
+    def add(self, memory: Memory, increments: int) -> None:
+        """
+        Add increments to the recall of memory without marking it as recalled, used when duplicates are merged into it
+        """
+        with self.lock:
+            entry = self._get_entry(memory)
+            entry[1] += increments
+            memory.recall = entry[0] + entry[1]
+
+    async def flush(self) -> int:
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        if not pending:
+            return 0
+        updates = [
+            {"id": id, "recall": recall + increments, **({"last_recalled_at": recalled_at} if recalled_at else {})}
+            for id, (recall, increments, recalled_at) in pending.items()
+        ]
+        try:
+            await self.search_client.update_memories(updates)
+        except Exception:
+            self._restore(pending)
+            raise
+        with self.lock:
+            for update in updates:
+                self.known_recalls[update["id"]] = update["recall"]
+                self.known_recalls.move_to_end(update["id"])
+            while len(self.known_recalls) > self.max_known_recalls:
+                self.known_recalls.popitem(last=False)
+        self.stats["flushes"] += 1
+        self.stats["updates"] += len(updates)
+        return len(updates)
+
+    def _restore(self, pending: dict[str, list]) -> None:
+        # A failed flush puts its increments back so they are written by the next one.
+        with self.lock:
+            for id, (recall, increments, recalled_at) in pending.items():
+                entry = self.pending.get(id)
+                if entry is None:
+                    self.pending[id] = [recall, increments, recalled_at]
+                else:
+                    entry[0] = recall
+                    entry[1] += increments
+                    entry[2] = entry[2] or recalled_at
+
+    def _get_entry(self, memory: Memory) -> list:
+        entry = self.pending.get(memory.id)
+        if entry is None:
+            entry = self.pending[memory.id] = [max(memory.recall, self.known_recalls.get(memory.id, 0)), 0, None]
+        return entry
+
+    async def start(self) -> None:
+        """
+        Start the periodic flush on the running event loop
+        """
+        if self.task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.flush_event = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the periodic flush and write back everything still buffered
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            self.flush_event = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing memory recalls: {e}")
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {**self.stats, "pending": len(self.pending)}
@@ -1,33 +1,78 @@
 import json
-from openai import AzureOpenAI
+import asyncio
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
 from autogen_agentchat.base import TaskResult
 from autogen_agentchat.messages import AgentEvent, ChatMessage, TextMessage
 
 from src.agents.aarma import AssistantAnswerRefinedMemoryAgent
+from src.agents.base import MarkBaseAgent
+from src.agents.frma import FusedRefinedMemoryAgent
+from src.agents.pool import AgentPool
 from src.agents.rrma import ResidualRefinedMemoryAgent
 from src.agents.uqrma import UserQuestionRefinedMemoryAgent
-from src.memory.azure_ai_search import AzureAISearch
+from src.embedding.cache import EmbeddingCache
+from src.embedding.service import EmbeddingService
+from src.memory.base import MemoryStore
+from src.memory.cached_store import CachedMemoryStore
 from src.memory.model import Memory, ResidualMemory, UserQuestionMemory, AssistantResponseMemory
+from src.memory.recall_tracker import RecallTracker
+from src.service.memory_consolidator import group_memories, merge_duplicates
+from src.service.memory_evictor import MemoryEvictor
+
+# (agent class, JSON key of the agent response, memory class, log label), in the order memories are returned.
+MEMORY_EXTRACTORS = [
+    (ResidualRefinedMemoryAgent, "residual_refined_memory", ResidualMemory, "Residual Memory"),
+    (UserQuestionRefinedMemoryAgent, "user_question_refined_memory", UserQuestionMemory, "User Question Memory"),
+    (AssistantAnswerRefinedMemoryAgent, "llm_response_refined_memory", AssistantResponseMemory, "Assistant Response Memory"),
+]
 
 class MemoryBuilder:
-    def __init__(self, model_client: AzureOpenAIChatCompletionClient, search_client: AzureAISearch,
-                 embedding_client: AzureOpenAI, embedding_model: str):
+    def __init__(self, model_client: AzureOpenAIChatCompletionClient, search_client: MemoryStore,
+                 embedding_client: AzureOpenAI, embedding_model: str, async_embedding_client: AsyncAzureOpenAI = None,
+                 embedding_cache: EmbeddingCache = None, embedding_service: EmbeddingService = None,
+                 extraction_mode: str = "sequential", consolidation_threshold: float = None,
+                 memory_evictor: MemoryEvictor = None, max_agents: int = 8, recall_tracker: RecallTracker = None):
+        if extraction_mode not in ("sequential", "concurrent", "fused"):
+            raise ValueError(f"Invalid extraction mode: {extraction_mode}")
+        self.extraction_mode = extraction_mode
+        # Cosine similarity above which a new memory is folded into an existing one instead of being inserted.
+        self.consolidation_threshold = consolidation_threshold
+        self.memory_evictor = memory_evictor
+        # Recall changes of consolidated memories go through the tracker, so its buffered increments build on them.
+        self.recall_tracker = recall_tracker
         self.search_client = search_client
         self.embedding_client = embedding_client
+        self.async_embedding_client = async_embedding_client
+        self.embedding_cache = embedding_cache
+        if embedding_service is None:
+            embedding_service = EmbeddingService(embedding_client=embedding_client, model=embedding_model, embedding_cache=embedding_cache)
+        self.embedding_service = embedding_service
         self.embedding_model = embedding_model
         self.model_client = model_client
-        self.assistant_answer_refined_memory_agent = AssistantAnswerRefinedMemoryAgent(model_client=self.model_client).get_agent()
-        self.residual_refined_memory_agent = ResidualRefinedMemoryAgent(model_client=self.model_client).get_agent()
-        self.user_question_refined_memory_agent = UserQuestionRefinedMemoryAgent(model_client=self.model_client).get_agent()
-
-    async def _reset_all_agents(self) -> None:
-        await self.assistant_answer_refined_memory_agent.on_reset(cancellation_token=None)
-        await self.residual_refined_memory_agent.on_reset(cancellation_token=None)
-        await self.user_question_refined_memory_agent.on_reset(cancellation_token=None)
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        # One pool per memory agent, every extraction borrows an agent with an empty model context,
+        # so concurrent build_memory calls never share one and agents are not rebuilt per call.
+        self.agent_pools = {
+            agent_class: AgentPool(lambda agent_class=agent_class: agent_class(model_client=self.model_client).get_agent(), max_size=max_agents)
+            for agent_class in [extractor[0] for extractor in MEMORY_EXTRACTORS] + [FusedRefinedMemoryAgent]
+        }
     
     def encode_text(self, text: str) -> list[float]:
-        return self.embedding_client.embeddings.create(input=text, model=self.embedding_model).data[0].embedding
+        return self.embedding_service.embed(text)
+    
+    async def encode_text_async(self, text: str) -> list[float]:
+        if self.async_embedding_client is None:
+            return await self.embedding_service.aembed(text)
+        if self.embedding_cache is not None:
+            vector = self.embedding_cache.get(self.embedding_model, text)
+            if vector is not None:
+                return vector
+        response = await self.async_embedding_client.embeddings.create(input=text, model=self.embedding_model)
+        vector = response.data[0].embedding
+        if self.embedding_cache is not None:
+            self.embedding_cache.set(self.embedding_model, text, vector)
+        return vector
     
     async def build_memory(self, conversation: list[AgentEvent | ChatMessage | TaskResult | TextMessage ], user: str, agent: str) -> list[Memory]:
         if len(conversation) < 2:
@@ -50,64 +95,123 @@ class MemoryBuilder:
                 conversation_str += f"Assistant: {event.message}\n"
         conversation_message = TextMessage(content=conversation_str, source="User")
         
-        res_response_stream = self.residual_refined_memory_agent.on_messages_stream(messages=[conversation_message], cancellation_token=None)
-        async for msg in res_response_stream:
-            memory_txt = msg.chat_message.content
-            memory_txt = memory_txt.replace("{{", "{").replace("}}", "}")
-            print(f"Residual Memory: {memory_txt}")
-            try:
-                for memory_value in json.loads(memory_txt)["residual_refined_memory"]:
-                    memory = ResidualMemory(memory=memory_value, user=user, agent=agent)
-                    memories.append(memory)
-            except Exception as e:
-                print(f"Error parsing memory: {e}")
-                memory = ResidualMemory(memory=memory_txt, user=user, agent=agent)
-                memories.append(memory)
-        
-        user_response_stream = self.user_question_refined_memory_agent.on_messages_stream(messages=[conversation_message], cancellation_token=None)
-        async for msg in user_response_stream:
+        if self.extraction_mode == "fused":
+            # One call with a JSON-schema response replaces the three extraction prompts.
+            async with self.agent_pools[FusedRefinedMemoryAgent].agent() as fused_agent:
+                memories = await self._extract_fused_memories(fused_agent, conversation_message, user, agent)
+        elif self.extraction_mode == "concurrent":
+            extracted = await asyncio.gather(*[
+                self._extract_pooled_memories(agent_class, key, memory_class, label, conversation_message, user, agent)
+                for agent_class, key, memory_class, label in MEMORY_EXTRACTORS
+            ])
+            memories = [memory for memory_list in extracted for memory in memory_list]
+        else:
+            for agent_class, key, memory_class, label in MEMORY_EXTRACTORS:
+                memories += await self._extract_pooled_memories(agent_class, key, memory_class, label,
+                                                                conversation_message, user, agent)
+    
+        if len(conversation) == 2:
+            tmp_memories = []
+            for memory in memories:
+                if isinstance(memory, AssistantResponseMemory):
+                    tmp_memories.append(memory)
+            memories = tmp_memories
+        return memories
+    
+    async def _extract_pooled_memories(self, agent_class: type, key: str, memory_class: type[Memory], label: str,
+                                       conversation_message: TextMessage, user: str, agent: str) -> list[Memory]:
+        async with self.agent_pools[agent_class].agent() as memory_agent:
+            return await self._extract_memories(memory_agent, key, memory_class, label, conversation_message, user, agent)
+
+    async def _extract_memories(self, memory_agent: MarkBaseAgent, key: str, memory_class: type[Memory], label: str,
+                                conversation_message: TextMessage, user: str, agent: str) -> list[Memory]:
+        memories = []
+        response_stream = memory_agent.on_messages_stream(messages=[conversation_message], cancellation_token=None)
+        async for msg in response_stream:
+            self._track_usage(msg.chat_message.models_usage)
             memory_txt = msg.chat_message.content
             memory_txt = memory_txt.replace("{{", "{").replace("}}", "}")
-            print(f"User Question Memory: {memory_txt}")
+            print(f"{label}: {memory_txt}")
             try:
-                for memory_value in json.loads(memory_txt)["user_question_refined_memory"]:
-                    memory = UserQuestionMemory(memory=memory_value, user=user, agent=agent)
+                for memory_value in json.loads(memory_txt)[key]:
+                    memory = memory_class(memory=memory_value, user=user, agent=agent)
                     memories.append(memory)
             except Exception as e:
                 print(f"Error parsing memory: {e}")
-                memory = UserQuestionMemory(memory=memory_txt, user=user, agent=agent)
+                memory = memory_class(memory=memory_txt, user=user, agent=agent)
                 memories.append(memory)
-        
-        assistant_response_stream = self.assistant_answer_refined_memory_agent.on_messages_stream(messages=[conversation_message], cancellation_token=None)
-        async for msg in assistant_response_stream:
+        return memories
+
+    async def _extract_fused_memories(self, memory_agent: MarkBaseAgent, conversation_message: TextMessage,
+                                      user: str, agent: str) -> list[Memory]:
+        memories = []
+        response_stream = memory_agent.on_messages_stream(messages=[conversation_message], cancellation_token=None)
+        async for msg in response_stream:
+            self._track_usage(msg.chat_message.models_usage)
             memory_txt = msg.chat_message.content
             memory_txt = memory_txt.replace("{{", "{").replace("}}", "}")
-            print(f"Assistant Response Memory: {memory_txt}")
+            print(f"Fused Memory: {memory_txt}")
             try:
-                for memory_value in json.loads(memory_txt)["llm_response_refined_memory"]:
-                    memory = AssistantResponseMemory(memory=memory_value, user=user, agent=agent)
-                    memories.append(memory)
+                memory_json = json.loads(memory_txt)
+                for _, key, memory_class, _ in MEMORY_EXTRACTORS:
+                    for memory_value in memory_json.get(key, []):
+                        memories.append(memory_class(memory=memory_value, user=user, agent=agent))
             except Exception as e:
                 print(f"Error parsing memory: {e}")
-                memory = AssistantResponseMemory(memory=memory_txt, user=user, agent=agent)
-                memories.append(memory)
-    
-        if len(conversation) == 2:
-            tmp_memories = []
-            for memory in memories:
-                if isinstance(memory, AssistantResponseMemory):
-                    tmp_memories.append(memory)
-            memories = tmp_memories
-        await self._reset_all_agents()
+                memories.append(ResidualMemory(memory=memory_txt, user=user, agent=agent))
         return memories
 
+    def _track_usage(self, usage) -> None:
+        if usage is None:
+            return
+        self.usage["calls"] += 1
+        self.usage["prompt_tokens"] += usage.prompt_tokens
+        self.usage["completion_tokens"] += usage.completion_tokens
+
     async def persist_memory(self, memories: list[Memory]) -> None:
-        memories_with_embeddings = []
-        for memory in memories:
-            if not memory.memoryVector:
-                memory.memoryVector = self.encode_text(memory.memory)
-            memories_with_embeddings.append(memory)
-        await self.search_client.upload_memories(memories=memories_with_embeddings)
+        missing = [memory for memory in memories if not memory.memoryVector]
+        vectors = await asyncio.gather(*[self.encode_text_async(memory.memory) for memory in missing])
+        for memory, vector in zip(missing, vectors):
+            memory.memoryVector = vector
+        if self.consolidation_threshold is not None:
+            memories = await self._consolidate_memories(memories)
+        await self.search_client.upload_memories(memories=memories)
+        if self.memory_evictor is not None:
+            for type, user, agent in group_memories(memories):
+                await self.memory_evictor.evict_if_needed(type=type, user=user, agent=agent)
+
+    async def _consolidate_memories(self, memories: list[Memory]) -> list[Memory]:
+        # Near-duplicates within the batch are merged first, then each survivor is matched against the store.
+        new_memories = []
+        for group in group_memories(memories).values():
+            new_memories += merge_duplicates(group, self.consolidation_threshold)[0]
+        matches = await asyncio.gather(*[
+            asyncio.to_thread(self.search_client.search_similar_memories, query_vector=memory.memoryVector, type=memory.type,
+                              user=memory.user, agent=memory.agent, top=1, similarity_threshold=self.consolidation_threshold)
+            for memory in new_memories
+        ])
+        increments = {}
+        memories = []
+        for memory, similar in zip(new_memories, matches):
+            if not similar:
+                memories.append(memory)
+                continue
+            existing, count = increments.get(similar[0].id, (similar[0], 0))
+            increments[existing.id] = (existing, count + memory.recall + 1)
+        if increments:
+            print(f"Consolidated {len(new_memories) - len(memories)} memories into {len(increments)} existing memories")
+            if self.recall_tracker is not None:
+                for existing, count in increments.values():
+                    self.recall_tracker.add(existing, count)
+                await self.recall_tracker.flush()
+            else:
+                await self.search_client.update_memories([
+                    {"id": existing.id, "recall": existing.recall + count} for existing, count in increments.values()
+                ])
+            # Recall-only updates keep the retrieval cache, but cached results of these types now carry stale recall counts.
+            if isinstance(self.search_client, CachedMemoryStore):
+                self.search_client.invalidate({existing.type for existing, _ in increments.values()})
+        return memories
     
     def get_memory_string(self, type: str, memories: list[Memory]) -> str:
         memory_string = f"{type} Memories:\n"
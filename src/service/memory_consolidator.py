@@ -0,0 +1,100 @@
+import time
+import numpy as np
+
+from src.memory.base import MemoryStore, MEMORY_TYPES
+from src.memory.model import Memory
+
+
+def find_duplicates(vectors: np.ndarray, similarity_threshold: float, block_size: int = 256) -> np.ndarray:
+    """
+    Greedy clustering over the rows of vectors, in order. Every row is assigned the index of the first
+    earlier row it is at least similarity_threshold (cosine) similar to, or its own index when there is none.
+    """
+    count = len(vectors)
+    canonical = np.arange(count)
+    if count < 2:
+        return canonical
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = (vectors / norms).astype(np.float32)
+    is_canonical = np.ones(count, dtype=bool)
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        block = vectors[start:stop]
+        # Earlier blocks are settled, so only their canonical rows can absorb rows of this block.
+        previous = np.flatnonzero(is_canonical[:start])
+        previous_similarities = block @ vectors[previous].T
+        block_similarities = block @ block.T
+        for offset in range(stop - start):
+            matches = np.flatnonzero(previous_similarities[offset] >= similarity_threshold)
+            if len(matches):
+                canonical[start + offset] = previous[matches[0]]
+            else:
+                matches = np.flatnonzero((block_similarities[offset, :offset] >= similarity_threshold) & is_canonical[start:start + offset])
+                if not len(matches):
+                    continue
+                canonical[start + offset] = start + matches[0]
+            is_canonical[start + offset] = False
+    return canonical
+
+
+def merge_duplicates(memories: list[Memory], similarity_threshold: float) -> tuple[list[Memory], list[Memory]]:
+    """
+    Fold near-duplicate memories into the first occurrence, adding each duplicate's recall plus one to it.
+    Returns the kept memories and the absorbed duplicates. Memories must share type, user and agent.
+    """
+    if len(memories) < 2:
+        return memories, []
+    canonical = find_duplicates(np.asarray([memory.memoryVector for memory in memories], dtype=np.float32), similarity_threshold)
+    kept = []
+    duplicates = []
+    for row, memory in enumerate(memories):
+        if canonical[row] == row:
+            kept.append(memory)
+        else:
+            memories[canonical[row]].recall += memory.recall + 1
+            duplicates.append(memory)
+    return kept, duplicates
+
+
+def group_memories(memories: list[Memory]) -> dict[tuple[str, str, str], list[Memory]]:
+    groups = {}
+    for memory in memories:
+        groups.setdefault((memory.type, memory.user, memory.agent), []).append(memory)
+    return groups
+
+
+class MemoryConsolidator:
+    """
+    Offline compaction: merges near-duplicate memories that already live in a memory store.
+    The oldest memory of every duplicate cluster is kept and its recall absorbs the others.
+    """
+    def __init__(self, search_client: MemoryStore, similarity_threshold: float = 0.95):
+        self.search_client = search_client
+        self.similarity_threshold = similarity_threshold
+
+    async def compact(self, types: list[str] = MEMORY_TYPES, user: str = None, agent: str = None, dry_run: bool = False) -> dict:
+        start = time.perf_counter()
+        report = {"memories": 0, "kept": 0, "deleted": 0, "groups": 0}
+        for type in types:
+            memories = list(self.search_client.iter_memories(type=type, user=user, agent=agent))
+            report["memories"] += len(memories)
+            updates = []
+            deleted_ids = []
+            for group in group_memories(memories).values():
+                group.sort(key=lambda memory: memory.created_at or "")
+                recalls = {memory.id: memory.recall for memory in group}
+                kept, duplicates = merge_duplicates(group, self.similarity_threshold)
+                report["groups"] += 1
+                report["kept"] += len(kept)
+                deleted_ids += [memory.id for memory in duplicates]
+                updates += [{"id": memory.id, "recall": memory.recall} for memory in kept if memory.recall != recalls[memory.id]]
+            report["deleted"] += len(deleted_ids)
+            print(f"{type}: {len(memories)} memories, {len(deleted_ids)} near-duplicates")
+            if dry_run:
+                continue
+            # Canonical memories are updated before duplicates are removed, so an interrupted run never loses recall.
+            await self.search_client.update_memories(updates)
+            await self.search_client.delete_memories(deleted_ids)
+        report["seconds"] = time.perf_counter() - start
+        return report
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import asyncio
+from datetime import datetime
+
+from src.memory.base import MemoryStore, MEMORY_TYPES
+from src.memory.model import Memory
+
+EVICTION_POLICIES = ["lru", "lfu", "decay"]
+EVICTION_SCOPES = ["user", "agent"]
+
+
+def parse_timestamp(value: str | None) -> float:
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def create_memory_evictor(search_client: MemoryStore, archive_path: str = None):
+    """
+    Create the evictor configured by MEMORY_EVICTION_MAX_MEMORIES, MEMORY_EVICTION_POLICY and MEMORY_EVICTION_SCOPE,
+    eviction is disabled (None) when no cap is set
+    """
+    max_memories = os.environ.get("MEMORY_EVICTION_MAX_MEMORIES")
+    if not max_memories:
+        return None
+    return MemoryEvictor(
+        search_client=search_client,
+        max_memories=int(max_memories),
+        policy=os.environ.get("MEMORY_EVICTION_POLICY", "decay"),
+        scope=os.environ.get("MEMORY_EVICTION_SCOPE", "user"),
+        archive_path=archive_path,
+    )
+
+
+class MemoryEvictor:
+    """
+    Keeps at most max_memories memories of every type per user (or per agent) by evicting the coldest ones.
+    Policies:
+    - lru: least recently recalled first (creation time when a memory was never recalled)
+    - lfu: fewest recalls first, least recently recalled breaks ties
+    - decay: lowest (recall + 1) * 0.5 ** (days since last use / half_life_days) first
+    Evicted memories are appended to archive_path (JSONL, vectors included) before they are deleted.
+    """
+    def __init__(self, search_client: MemoryStore, max_memories: int = 1000, policy: str = "decay", scope: str = "user",
+                 half_life_days: float = 30.0, archive_path: str = None):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Invalid eviction policy: {policy}")
+        if scope not in EVICTION_SCOPES:
+            raise ValueError(f"Invalid eviction scope: {scope}")
+        self.search_client = search_client
+        self.max_memories = max_memories
+        self.policy = policy
+        self.scope = scope
+        self.half_life_days = half_life_days
+        self.archive_path = archive_path
+
+    def get_score(self, memory: Memory, now: float) -> tuple:
+        last_used = parse_timestamp(memory.last_recalled_at) or parse_timestamp(memory.created_at)
+        if self.policy == "lru":
+            return (last_used,)
+        if self.policy == "lfu":
+            return (memory.recall, last_used)
+        age_days = max(0.0, now - last_used) / 86400
+        return ((memory.recall + 1) * 0.5 ** (age_days / self.half_life_days), last_used)
+
+    async def evict(self, types: list[str] = MEMORY_TYPES, user: str = None, agent: str = None, dry_run: bool = False) -> dict:
+        """
+        Enforce the cap on every scope holding memories of the given types
+        """
+        start = time.perf_counter()
+        report = {"memories": 0, "evicted": 0, "scopes": 0}
+        for type in types:
+            groups = {}
+            for memory in await asyncio.to_thread(self._list_memories, type, user, agent):
+                groups.setdefault(getattr(memory, self.scope), []).append(memory)
+                report["memories"] += 1
+            evicted = []
+            for memories in groups.values():
+                report["scopes"] += 1
+                evicted += self._select_evictions(memories)
+            report["evicted"] += len(evicted)
+            print(f"{type}: {sum(len(memories) for memories in groups.values())} memories, {len(evicted)} to evict")
+            if not dry_run:
+                await self._evict_memories(evicted)
+        report["seconds"] = time.perf_counter() - start
+        return report
+
+    async def evict_if_needed(self, type: str, user: str = None, agent: str = None) -> int:
+        """
+        Evict within a single scope, only listing its memories when the cap is exceeded
+        """
+        user = user if self.scope == "user" else None
+        agent = agent if self.scope == "agent" else None
+        # Store calls are synchronous (HTTP requests on Azure), they run in a worker thread to keep the event loop free.
+        count = await asyncio.to_thread(self.search_client.count_memories, type=type, user=user, agent=agent)
+        if count <= self.max_memories:
+            return 0
+        evicted = self._select_evictions(await asyncio.to_thread(self._list_memories, type, user, agent))
+        await self._evict_memories(evicted)
+        return len(evicted)
+
+    def _select_evictions(self, memories: list[Memory]) -> list[Memory]:
+        if len(memories) <= self.max_memories:
+            return []
+        now = time.time()
+        memories = sorted(memories, key=lambda memory: self.get_score(memory, now))
+        return memories[:len(memories) - self.max_memories]
+
+    async def _evict_memories(self, memories: list[Memory]) -> None:
+        if not memories:
+            return
+        if self.archive_path:
+            await asyncio.to_thread(self._archive, memories)
+        await self.search_client.delete_memories([memory.id for memory in memories])
+        print(f"Evicted {len(memories)} memories")
+
+    def _list_memories(self, type: str, user: str = None, agent: str = None) -> list[Memory]:
+        return list(self.search_client.iter_memories(type=type, user=user, agent=agent))
+
+    def _archive(self, memories: list[Memory]) -> None:
+        directory = os.path.dirname(self.archive_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.archive_path, "a") as f:
+            for memory in memories:
+                f.write(json.dumps(memory.to_dict()))
+                f.write("\n")
@@ -1,2 +1,6 @@
 class Constants:
-    sqlite_db_file_name = "sql_copilot.sqlite.db"
\ No newline at end of file
+    sqlite_db_file_name = "sql_copilot.sqlite.db"
+    embedding_cache_path = ".embedding_cache/embeddings.sqlite"
+    key_point_cache_path = ".evaluation_cache/key_points.sqlite"
+    memory_archive_path = ".memory_archive/evicted_memories.jsonl"
+    dataset_cache_path = ".dataset_cache"
\ No newline at end of file
@@ -0,0 +1,25 @@
+import time
+import random
+from typing import Callable, Any
+
+
+def get_backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 30.0) -> float:
+    """
+    Exponential backoff with jitter for the given zero-based attempt
+    """
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+def retry_with_backoff(func: Callable[..., Any], *args, retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                       should_retry: Callable[[Exception], bool] = lambda e: True, **kwargs) -> Any:
+    """
+    Call func(*args, **kwargs), retrying with exponential backoff and jitter while should_retry(exception) is True
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not should_retry(e):
+                raise
+            time.sleep(get_backoff_delay(attempt, base_delay, max_delay))
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+import tiktoken
+from autogen_core.models import UserMessage
+
+from src.agents.context import MEMORY_MARKER, TokenBudgetChatCompletionContext
+
+
+class FakeEncoding:
+    def encode(self, text: str, disallowed_special="all") -> list[str]:
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def fake_encoding(monkeypatch):
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: FakeEncoding())
+
+
+def get_messages(max_tokens: int, history: list[UserMessage]) -> list[UserMessage]:
+    # MarkBaseAgent adds the replayed history, assistant replies included, as UserMessage.
+    context = TokenBudgetChatCompletionContext(max_tokens=max_tokens, initial_messages=history)
+    return asyncio.run(context.get_messages())
+
+
+def conversation(turns: int) -> list[UserMessage]:
+    history = []
+    for turn in range(turns):
+        history.append(UserMessage(content=f"question {turn} " + "word " * 10, source="User"))
+        history.append(UserMessage(content=f"answer {turn} " + "word " * 10, source="Assistant"))
+    return history
+
+
+def test_trimmed_history_starts_at_user_question():
+    history = conversation(3) + [UserMessage(content="latest question", source="User")]
+    for max_tokens in range(1, 100):
+        messages = get_messages(max_tokens, history)
+        assert messages[0].source == "User"
+        assert messages[-1].content == "latest question"
+        # Every reply kept is preceded by the question it answers.
+        for i, message in enumerate(messages):
+            if message.source == "Assistant":
+                assert messages[i - 1].content.split()[:2] == ["question", message.content.split()[1]]
+
+
+def test_whole_turns_are_dropped():
+    history = conversation(3) + [UserMessage(content="latest question", source="User")]
+    messages = get_messages(40, history)
+    assert [message.content.split()[:2] for message in messages] == [["question", "2"], ["answer", "2"], ["latest", "question"]]
+
+
+def test_memories_are_stripped_from_earlier_questions_only():
+    history = [
+        UserMessage(content=f"first question\n\n{MEMORY_MARKER} old memory", source="User"),
+        UserMessage(content="first answer", source="Assistant"),
+        UserMessage(content=f"second question\n\n{MEMORY_MARKER} new memory", source="User"),
+    ]
+    messages = get_messages(100, history)
+    assert messages[0].content == "first question"
+    assert messages[2].content == history[2].content
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+import tiktoken
+
+from src.embedding.service import EmbeddingService
+
+SPECIAL_TOKEN = "<|endoftext|>"
+TIMEOUT = 5
+
+
+class FakeEncoding:
+    # Mirrors tiktoken: special tokens raise unless they are explicitly allowed.
+    def encode(self, text: str, disallowed_special="all") -> list[str]:
+        if disallowed_special == "all" and SPECIAL_TOKEN in text:
+            raise ValueError(f"Encountered text corresponding to disallowed special token {SPECIAL_TOKEN!r}.")
+        return text.split()
+
+
+class FakeEmbeddingClient:
+    def __init__(self, drop_results: bool = False):
+        self.drop_results = drop_results
+        self.calls = []
+        self.embeddings = SimpleNamespace(create=self.create)
+
+    def create(self, input: list[str], model: str):
+        self.calls.append(list(input))
+        data = [SimpleNamespace(index=i, embedding=[float(len(text)), 1.0]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data[:-1] if self.drop_results else data)
+
+
+@pytest.fixture(autouse=True)
+def fake_encoding(monkeypatch):
+    monkeypatch.setattr(tiktoken, "get_encoding", lambda name: FakeEncoding())
+
+
+def embed(service: EmbeddingService, text: str) -> list[float]:
+    return service._submit(text).result(timeout=TIMEOUT)
+
+
+def test_special_tokens_are_embedded():
+    with EmbeddingService(FakeEmbeddingClient(), model="fake") as service:
+        text = f"answer {SPECIAL_TOKEN} more"
+        assert embed(service, text) == [float(len(text)), 1.0]
+
+
+def test_failed_batch_resolves_every_caller():
+    client = FakeEmbeddingClient(drop_results=True)
+    with EmbeddingService(client, model="fake") as service:
+        futures = service._submit_many(["first text", "second text"])
+        with pytest.raises(KeyError):
+            futures[1].result(timeout=TIMEOUT)
+        client.drop_results = False
+        assert embed(service, "third text") == [10.0, 1.0]
+
+
+def test_dead_worker_is_restarted():
+    with EmbeddingService(FakeEmbeddingClient(), model="fake") as service:
+        embed(service, "warm up")
+        service.queue.put(None)
+        service.worker.join(timeout=TIMEOUT)
+        assert not service.worker.is_alive()
+        assert embed(service, "after restart") == [13.0, 1.0]
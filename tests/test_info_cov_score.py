@@ -0,0 +1,66 @@
+import re
+import zlib
+import random
+
+import numpy as np
+
+from src.data.model import EvaluationData
+from src.evaluation.info_cov_score import InformationCoverageScore
+
+
+class FakeEmbeddingService:
+    def __init__(self, dimensions: int = 64):
+        self.dimensions = dimensions
+
+    def embed_many(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text: str) -> list[float]:
+        rng = random.Random(zlib.crc32(text.encode("utf-8")))
+        return [rng.uniform(-1.0, 1.0) for _ in range(self.dimensions)]
+
+
+def baseline_coverage(generated: str, expected: str, threshold: float, embedding_service: FakeEmbeddingService) -> float:
+    # Pure Python metric the vectorized kernel replaced.
+    generated_vectors = embedding_service.embed_many(re.split(r'(?<=[.!?])\s+(?=[A-Z0-9])', generated))
+    expected_vectors = embedding_service.embed_many(re.split(r'(?<=[.!?])\s+(?=[A-Z0-9])', expected))
+    def cosine(a, b):
+        return sum([x * y for x, y in zip(a, b)]) / (sum([x ** 2 for x in a]) ** 0.5 * sum([y ** 2 for y in b]) ** 0.5)
+    counts = []
+    for generated_vector in generated_vectors:
+        similarities = [float(cosine(generated_vector, expected_vector)) for expected_vector in expected_vectors]
+        counts.append(len([sim for sim in similarities if sim >= np.quantile(similarities, threshold)]))
+    return float(np.mean([count / len(expected_vectors) for count in counts]))
+
+
+def make_answer(sentences: list[str]) -> str:
+    return " ".join(sentences)
+
+
+def test_duplicate_sentences_match_baseline():
+    embedding_service = FakeEmbeddingService()
+    metric = InformationCoverageScore()
+    pool = [f"Sentence number {i} about topic {i % 7}." for i in range(30)]
+    rng = random.Random(7)
+    answers = []
+    for i in range(40):
+        expected = rng.sample(pool, rng.randint(2, 6))
+        generated = rng.sample(pool, rng.randint(1, 5))
+        # Repeated sentences produce identical similarities, which must stay tied at the quantile.
+        expected.append(rng.choice(expected))
+        generated.append(rng.choice(generated))
+        answers.append(EvaluationData(question=f"q{i}", generated_answer=make_answer(generated), expected_answer=make_answer(expected)))
+    metric.evaluate(answers=answers, cosine_similarity_threshold=0.9, embedding_client=object(), model="fake",
+                    embedding_service=embedding_service)
+    for answer in answers:
+        assert answer.in_cov_cs_score == baseline_coverage(answer.generated_answer, answer.expected_answer, 0.9, embedding_service)
+
+
+def test_repeated_generated_sentence():
+    embedding_service = FakeEmbeddingService()
+    metric = InformationCoverageScore()
+    answer = EvaluationData(question="q", generated_answer="Alpha one. Alpha one. Beta two.",
+                            expected_answer="Alpha one. Gamma three. Alpha one. Delta four. Beta two.")
+    metric.evaluate(answers=[answer], cosine_similarity_threshold=0.9, embedding_client=object(), model="fake",
+                    embedding_service=embedding_service)
+    assert answer.in_cov_cs_score == baseline_coverage(answer.generated_answer, answer.expected_answer, 0.9, embedding_service)